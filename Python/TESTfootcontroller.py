@@ -1,986 +1,2815 @@
-####Issues outstanding#####
-# there is redundancy in the state_tracker that is worth optimizing
-# takes a while for the track to start up
-# if the delete from VR is implemented for single tracks, make sure you can't delete the first clip from player 1 bc it's the base clip
- 
-from pythonosc import udp_client, dispatcher, osc_server
-import time
-import keyboard
-import threading
-
-# Global OSC dispatcher and server for receiving Ableton responses on port 11001 and from client 2 on client2_port
-global_dispatcher = dispatcher.Dispatcher()
-global_osc_server = None
-client2_dispatcher = dispatcher.Dispatcher()
-client2_osc_server = None
-
-base_clip_length = None  # Holds the length (in beats) of the first recorded clip.
-# Global toggling variables.
-waiting_for_refire_player1 = False
-waiting_for_refire_player2 = False
-current_active_track_player1 = None
-current_active_track_player2 = None
-all_clips_recorded = False   # Flag to indicate when all clips have been recorded
-
-# Global flag to control the running state
-running = True
-
-# Add separate processing flags for each player
-is_processing_player1 = False
-is_processing_player2 = False
-
-# Add thread locks for each player
-player1_lock = threading.Lock()
-player2_lock = threading.Lock()
-
-client = None  # global client variable
-client2_clients = []  # List of UDP clients for VR headsets
-
-# Helper function to send to all client2 addresses
-def send_to_all_client2_clients(clients, address, args):
-    for c in clients:
-        c.send_message(address, args)
-
-def fire_scene(client, client2_clients, state_tracker, e=None):
-    print("fire message sent for scene (only firing unarmed tracks)")
-    # Send to VR headsets via PC Transmitter port (9001)
-    for c in client2_clients:
-        c.send_message("/pcplayall", [True])
-    for i in range(8):
-        if not state_tracker.get_track_is_armed(i):
-            client.send_message("/live/clip_slot/fire", [i, 0])
-
-def stop_clips(client, client2_clients, e=None):
-    print("Stopping all clips (playback only)...")
-    # Send to VR headsets via PC Transmitter port (9001)
-    for c in client2_clients:
-        c.send_message("/pcplayall", [False])
-    client.send_message("/live/song/stop_all_clips", [])
-
-def delete_scene(client, client2_clients, state_tracker, e=None):
-    global base_clip_length, current_active_track_player1, current_active_track_player2
-    global waiting_for_refire_player1, waiting_for_refire_player2
-    print("fire message sent for scene")
-    for c in client2_clients:
-        c.send_message("/deleteall", [True])
-    for i in range(8):
-        client.send_message("/live/clip_slot/delete_clip", [i, 0])
-    # Reset all state
-    base_clip_length = None
-    current_active_track_player1 = None
-    current_active_track_player2 = None
-    waiting_for_refire_player1 = False
-    waiting_for_refire_player2 = False
-    state_tracker.reset()
-
-def handle_toggletrack(client, addr, *args):
-    # args should contain [player, track, state]
-    if len(args) < 3:
-        print(f"Malformed message: {args}")
-        return
-    
-    player = int(args[0])
-    track = int(args[1])
-    state = args[2]  # boolean value
-    
-
-    # Map to Ableton track index
-    if player == 1:
-        track_id = (track - 1) * 2  # 1→0, 2→2, 3→4, 4→6
-    elif player == 2:
-        track_id = (track - 1) * 2 + 1  # 1→1, 2→3, 3→5, 4→7
-    else:
-        print(f"Unknown player: {player}")
-        return
-
-    print(f"Player {player}, Track {track} (Ableton track {track_id}), State: {state}")
-
-    if state:
-        # Fire (play) the clip in slot 0
-        client.send_message("/live/clip_slot/fire", [track_id, 0])
-        # for c in client2_clients:
-        #     c.send_message("/clipisplaying", [player, track-1, state])
-    else:
-        # Stop the clip in slot 0
-        client.send_message("/live/clip/stop", [track_id, 0])
-        # for c in client2_clients:
-        #     c.send_message("/clipisplaying", [player, track-1, state])
-                            
-def start_global_osc_server():
-    global global_osc_server
-    ip = "127.0.0.1"
-    port = 11001  # Fixed port for receiving from Ableton.
-    global_osc_server = osc_server.ThreadingOSCUDPServer((ip, port), global_dispatcher)
-    thread = threading.Thread(target=global_osc_server.serve_forever, daemon=True)
-    thread.start()
-    print(f"Global OSC server started on {ip}:{port}")
-    return thread
-
-
-def start_client2_osc_server(client, client2_clients, state_tracker):
-    global client2_osc_server, client2_dispatcher
-    client2_ip = "0.0.0.0"
-    client2_port = 12000  # PC Receiver port to receive messages from headsets
-
-    # Only create if not already running
-    if client2_osc_server is not None:
-        print(f"Client2 OSC server already running on {client2_ip}:{client2_port}")
-        return
-
-    client2_dispatcher = dispatcher.Dispatcher()
-    # Handle messages from VR headsets
-    client2_dispatcher.map("/playall", lambda addr, *args: fire_scene(client, client2_clients, state_tracker) if args[0] else stop_clips(client, client2_clients, None))
-    client2_dispatcher.map("/deleteall", lambda addr, *args: delete_scene(client, client2_clients, state_tracker, None))
-    client2_dispatcher.map("/toggletrack", lambda addr, *args: handle_toggletrack(client, addr, *args))
-
-    client2_osc_server = osc_server.ThreadingOSCUDPServer((client2_ip, client2_port), client2_dispatcher)
-    thread = threading.Thread(target=client2_osc_server.serve_forever, daemon=True)
-    thread.start()
-    print(f"Client2 OSC server started on {client2_ip}:{client2_port}")
-    return thread
-
-# --- State Tracking ---
-class StateTracker:
-    def __init__(self):
-        # Designated tracks: Player 1 (1, 3, 5, 7) and Player 2 (2, 4, 6, 8)
-        self.track_has_clip = {0: False, 1: False, 2: False, 3: False, 4: False, 5: False, 6: False, 7: False}
-        self.track_is_armed = {0: False, 1: False, 2: False, 3: False, 4: False, 5: False, 6: False, 7: False}  # New: armed state
-        self.track_is_recording = {0: False, 1: False, 2: False, 3: False, 4: False, 5: False, 6: False, 7: False}  # New: recording state
-        self.track_is_playing = {i: False for i in range(8)}
-        self.clip_slot_index = 0  # Always using the first clip slot.
-        self.validation_interval = 1.0  #7.0 worked but the faster the better # For background validation.
-        self.validation_running = False
-        self.validation_thread = None
-        self.lock = threading.Lock()
-    
-    def mark_track_has_clip(self, track_index, has_clip=True):
-        with self.lock:
-            if track_index in self.track_has_clip:
-                self.track_has_clip[track_index] = has_clip
-                print(f"Internal state updated: Track {track_index+1} has clip: {has_clip}")
-
-    def mark_track_is_armed(self, track_index, is_armed):
-        with self.lock:
-            if track_index in self.track_is_armed:
-                self.track_is_armed[track_index] = is_armed
-                print(f"Internal state updated: Track {track_index+1} is armed: {is_armed}")
-
-    def get_track_is_armed(self, track_index):
-        with self.lock:
-            return self.track_is_armed.get(track_index, False)
-    
-    def get_next_empty_track(self, player):
-        with self.lock:
-            if player == 1:  # Player 1 tracks (1, 3, 5, 7)
-                for track_idx in [0, 2, 4, 6]:
-                    if not self.track_has_clip[track_idx]:
-                        return track_idx
-            elif player == 2:  # Player 2 tracks (2, 4, 6, 8)
-                for track_idx in [1, 3, 5, 7]:
-                    if not self.track_has_clip[track_idx]:
-                        return track_idx
-            return None
-    
-    def get_filled_tracks(self, player):
-        with self.lock:
-            if player == 1:
-                return [idx for idx in [0, 2, 4, 6] if self.track_has_clip[idx]]
-            elif player == 2:
-                return [idx for idx in [1, 3, 5, 7] if self.track_has_clip[idx]]
-    
-    def get_empty_tracks(self, player):
-        with self.lock:
-            if player == 1:
-                return [idx for idx in [0, 2, 4, 6] if not self.track_has_clip[idx]]
-            elif player == 2:
-                return [idx for idx in [1, 3, 5, 7] if not self.track_has_clip[idx]]
-    
-    def are_all_tracks_filled(self, player):
-        with self.lock:
-            if player == 1:
-                return all(self.track_has_clip[idx] for idx in [0, 2, 4, 6])
-            elif player == 2:
-                return all(self.track_has_clip[idx] for idx in [1, 3, 5, 7])
-    
-    def start_background_validation(self, client, ip_addresses):
-        if self.validation_thread is not None and self.validation_thread.is_alive():
-            print("Background validation already running")
-            return
-        self.validation_running = True
-        self.validation_thread = threading.Thread(
-            target=self._background_validation_loop,
-            args=(client, ip_addresses),
-            daemon=True
-        )
-        self.validation_thread.start()
-        print(f"Background validation started (every {self.validation_interval} seconds)")
-    
-    def stop_background_validation(self):
-        self.validation_running = False
-        if self.validation_thread:
-            self.validation_thread.join(timeout=1.0)
-            print("Background validation stopped")
-    
-    def _background_validation_loop(self, client, ip_addresses):
-        print("Background validation thread started")
-        while self.validation_running:
-            for _ in range(int(self.validation_interval * 2)):
-                if not self.validation_running:
-                    break
-                time.sleep(0.5)
-            if not self.validation_running:
-                break
-            try:
-                print("\n=== Background validation running ===")
-                self.validate_state_with_ableton(client)
-                self.send_full_clip_state_update(client2_clients)
-                print("=== Background validation complete ===\n")
-            except Exception as e:
-                print(f"Error in background validation: {e}")
-
-    def validate_state_with_ableton(self, client):
-        print("Validating internal clip state with Ableton...")
-        for track_idx in range(8):  # Check all tracks 1-8
-            has_clip = check_track_has_clip(client, track_idx, self.clip_slot_index)
-            self.mark_track_has_clip(track_idx, has_clip)
-            is_armed = check_track_is_armed(client, track_idx)
-            self.mark_track_is_armed(track_idx, is_armed)
-            is_recording = check_track_is_recording(client, track_idx, self.clip_slot_index)
-            self.mark_track_is_recording(track_idx, is_recording)
-            is_playing = check_track_is_playing(client, track_idx, self.clip_slot_index)
-            self.mark_track_is_playing(track_idx, is_playing)
-
-            filled_tracks = [t + 1 for t in self.get_filled_tracks(1)] + [t + 1 for t in self.get_filled_tracks(2)]
-            empty_tracks = [t + 1 for t in self.get_empty_tracks(1)] + [t + 1 for t in self.get_empty_tracks(2)]
-            print(f"Current state - Tracks with clips: {filled_tracks if filled_tracks else 'none'}")
-            print(f"Current state - Empty tracks: {empty_tracks if empty_tracks else 'none'}")
-            print(f"Current state - Armed tracks: {[i+1 for i, v in self.track_is_armed.items() if v]}")
-            print(f"Current state - Recording tracks: {[i+1 for i, v in self.track_is_recording.items() if v]}")
-
-        self.send_full_clip_state_update(client2_clients)
-
-    def get_clip_presence_grid(self, client):
-        """
-        Generates a grid of 0s and 1s representing the presence of clips.
-        The format is VROSC/t1/cs1/.../t8/cs3/...
-        """
-        grid = []
-
-        for track_idx in range(8):  # Tracks 1 to 8
-            for clip_slot in range(3):  # Clip slots 1 to 3
-                # Query Ableton for the presence of a clip in the specified track and slot
-                has_clip = check_track_has_clip(client, track_idx, clip_slot)
-                grid.append(1 if has_clip else 0)  # Append 1 if there's a clip, otherwise 0
-
-        return grid
-    
-    def send_full_clip_state_update(self, client2_clients):
-        presence = [1 if self.track_has_clip[i] else 0 for i in range(8)]
-        playing = [1 if self.track_is_playing[i] else 0 for i in range(8)]
-        recording = [1 if self.track_is_recording[i] else 0 for i in range(8)]
-        for c in client2_clients:
-            c.send_message("/VROSC/clippresence", presence)
-            c.send_message("/VROSC/clipisplaying", playing)
-            c.send_message("/VROSC/clipisrecording", recording)
-            print(f"Sent OSC to {c}: presence={presence}, playing={playing}, recording={recording}")
-
-    def get_next_track(self, current_track, player):
-        """
-        Returns the next track index in the series based on the player.
-        Wraps around to the first track if the end is reached.
-        """
-        if player == 1:
-            designated_tracks = [0, 2, 4, 6]  # Tracks 1, 3, 5, 7
-        else:
-            designated_tracks = [1, 3, 5, 7]  # Tracks 2, 4, 6, 8
-
-        current_index = designated_tracks.index(current_track)
-        next_index = (current_index + 1) % len(designated_tracks)
-        return designated_tracks[next_index]
-
-    def mark_track_is_recording(self, track_index, is_recording):
-        with self.lock:
-            if track_index in self.track_is_recording:
-                self.track_is_recording[track_index] = is_recording
-                print(f"Internal state updated: Track {track_index+1} is recording: {is_recording}")
-
-    def get_track_is_recording(self, track_index):
-        with self.lock:
-            return self.track_is_recording.get(track_index, False)
-
-    def mark_track_is_playing(self, track_index, is_playing):
-        with self.lock:
-            if track_index in self.track_is_playing:
-                self.track_is_playing[track_index] = is_playing
-                print(f"Internal state updated: Track {track_index+1} is playing: {is_playing}")
-
-    def get_track_is_playing(self, track_index):
-        with self.lock:
-            return self.track_is_playing.get(track_index, False)
-
-    def reset(self):
-        with self.lock:
-            for i in range(8):
-                self.track_has_clip[i] = False
-                self.track_is_armed[i] = False
-                self.track_is_recording[i] = False
-                self.track_is_playing[i] = False
-        print("StateTracker: All track states reset.")
-
-# --- OSC Query Helpers ---
-def query_clip_loop_points(client, track_index, clip_slot_index, timeout=6.0):
-    """
-    Queries Ableton for the loop start and end positions of a clip.
-    Returns [loop_start, loop_end] (in beats) or [None, None] if not available.
-    This function will wait (polling in a loop) until the timeout expires.
-    """
-    event = threading.Event()
-    result = [None, None]
-
-    def loop_start_handler(unused_addr, *args):
-        # Debug: print raw args received.
-        print(f"[DEBUG] Loop start handler received args: {args}")
-        if len(args) >= 3:
-            if int(args[0]) == track_index and int(args[1]) == clip_slot_index:
-                result[0] = float(args[2])
-                if result[1] is not None:
-                    event.set()
-
-    def loop_end_handler(unused_addr, *args):
-        print(f"[DEBUG] Loop end handler received args: {args}")
-        if len(args) >= 3:
-            if int(args[0]) == track_index and int(args[1]) == clip_slot_index:
-                result[1] = float(args[2])
-                if result[0] is not None:
-                    event.set()
-
-    global_dispatcher.map("/live/clip/get/loop_start", loop_start_handler)
-    global_dispatcher.map("/live/clip/get/loop_end", loop_end_handler)
-    
-    # Clear any previous messages in the queue
-    time.sleep(0.02)
-    
-    # Send the queries with a small delay between them
-    client.send_message("/live/clip/get/loop_start", [track_index, clip_slot_index])
-    time.sleep(0.05)  # Added delay between messages to ensure they're processed separately
-    client.send_message("/live/clip/get/loop_end", [track_index, clip_slot_index])
-    
-    start_time = time.time()
-    while not event.is_set() and time.time() - start_time < timeout:
-        time.sleep(0.1)
-    
-    global_dispatcher.unmap("/live/clip/get/loop_start", loop_start_handler)
-    global_dispatcher.unmap("/live/clip/get/loop_end", loop_end_handler)
-    
-    print(f"[DEBUG] Final query result for track {track_index+1}, slot {clip_slot_index+1}: {result}")
-    return result
-
-def enforce_clip_loop_points(client, track_index, clip_slot_index, expected_start, expected_end, delay=0.5, timeout=2.0):
-    """
-    After a delay, queries back the loop points and, if they do not match the expected values,
-    re-sends the set commands.
-    """
-    time.sleep(delay)
-    loop_points = query_clip_loop_points(client, track_index, clip_slot_index, timeout)
-    print(f"[DEBUG] Enforcement: Queried loop points for track {track_index+1}, slot {clip_slot_index+1}: {loop_points}")
-    if loop_points[0] != expected_start or loop_points[1] != expected_end:
-        print(f"[DEBUG] Loop points mismatch. Re-sending commands: start={expected_start}, end={expected_end}")
-        
-        # Clear any previous messages
-        time.sleep(0.02)
-        
-        # Send commands with delay between them
-        client.send_message("/live/clip/set/loop_start", [track_index, clip_slot_index, expected_start])
-        time.sleep(0.05)
-        client.send_message("/live/clip/set/loop_end", [track_index, clip_slot_index, expected_end])
-        
-        time.sleep(0.5)  # Wait for commands to be processed
-        
-        loop_points = query_clip_loop_points(client, track_index, clip_slot_index, timeout)
-        print(f"[DEBUG] Loop points after enforcement: {loop_points}")
-    else:
-        print("[DEBUG] Loop points correctly set.")
-
-# --- Initializing Base Clip Length ---
-def initialize_base_clip_length(client, state_tracker):
-    """
-    Attempts to get the loop length from track 0, clip 0 and set it as the base clip length.
-    """
-    global base_clip_length
-    
-    if not state_tracker.track_has_clip[0]:
-        print("[ERROR] Cannot initialize base clip length - track 1, slot 1 has no clip.")
-        return False
-    
-    print("[DEBUG] Initializing base clip length from track 1, slot 1...")
-    
-    # Try multiple times if needed
-    for attempt in range(3):
-        # Give Ableton time to finish processing
-        time.sleep(0.5)
-        
-        loop_points = query_clip_loop_points(client, 0, 0, timeout=2.0)
-        if loop_points[0] is not None and loop_points[1] is not None:
-            base_clip_length = loop_points[1] - loop_points[0]
-            print(f"[DEBUG] Base clip length set to {base_clip_length} beats (attempt {attempt+1}).")
-            return True
-        else:
-            print(f"[DEBUG] Failed to get loop points on attempt {attempt+1}, retrying...")
-    
-    print("[ERROR] Failed to initialize base clip length after multiple attempts.")
-    return False
-
-# --- Finalizing Recording ---
-def finalize_recording(client, track_index, clip_slot_index, state_tracker):
-    global base_clip_length, all_clips_recorded
-    print(f"[DEBUG] Finalizing recording on track {track_index+1}, slot {clip_slot_index+1}...")
-
-    time.sleep(1.0)
-
-    max_attempts = 20
-    attempt = 0
-    loop_points = [None, None]
-    while attempt < max_attempts:
-        loop_points = query_clip_loop_points(client, track_index, clip_slot_index, timeout=1.0)
-        if loop_points[0] is not None and loop_points[1] is not None:
-            break
-        attempt += 1
-        time.sleep(0.5)
-
-    print(f"[DEBUG] Final loop points for track {track_index+1}, slot {clip_slot_index+1}: {loop_points}")
-
-    if loop_points[0] is not None and loop_points[1] is not None:
-        clip_length = loop_points[1] - loop_points[0]
-
-        # Mark finalized track as having a clip
-        state_tracker.mark_track_has_clip(track_index, True)
-
-        if base_clip_length is None and track_index == 0 and clip_slot_index == 0:
-            base_clip_length = clip_length
-            print(f"[DEBUG] Base clip length updated to {base_clip_length} beats (from first clip).")
-
-        if state_tracker.are_all_tracks_filled(1) or state_tracker.are_all_tracks_filled(2):
-            print("[DEBUG] All designated tracks now have clips. Starting synchronization after delay...")
-            all_clips_recorded = True
-            update_timer = threading.Timer(2.0, update_all_clips_loop_points, args=(client, state_tracker))
-            update_timer.daemon = True
-            update_timer.start()
-    else:
-        print("[DEBUG] Unable to capture loop point values after finalization.")
-
-
-# --- Update All Clips Loop Points ---
-def update_all_clips_loop_points(client, state_tracker):
-    """
-    Updates all recorded clips to have the same loop_end value based on the global base_clip_length.
-    This is called automatically after all clips have been recorded or manually via keyboard shortcut.
-    """
-    global base_clip_length
-    
-    # If base_clip_length is not set, try to get it from track 0
-    if base_clip_length is None:
-        if not initialize_base_clip_length(client, state_tracker):
-            print("[ERROR] Cannot update clips - failed to establish base length.")
-            return
-    
-    filled_tracks = state_tracker.get_filled_tracks(1) + state_tracker.get_filled_tracks(2)
-    print(f"Updating loop points for all clips to match length: {base_clip_length} beats")
-    
-    for track_idx in filled_tracks:
-        print(f"Setting loop points for track {track_idx+1}, slot {state_tracker.clip_slot_index+1}")
-        
-        # Clear any previous messages
-        time.sleep(0.05)
-        
-        # Send the set commands with a delay between them
-        client.send_message("/live/clip/set/loop_start", [track_idx, state_tracker.clip_slot_index, 0.0])
-        time.sleep(0.05)
-        client.send_message("/live/clip/set/loop_end", [track_idx, state_tracker.clip_slot_index, base_clip_length])
-        
-        # Wait briefly before moving to the next track
-        time.sleep(0.2)
-    
-    # After setting all clips, verify each one in separate threads
-    for track_idx in filled_tracks:
-        threading.Thread(
-            target=enforce_clip_loop_points, 
-            args=(client, track_idx, state_tracker.clip_slot_index, 0.0, base_clip_length),
-            daemon=True
-        ).start()
-        # Stagger the verification threads
-        time.sleep(0.1)
-    
-    print("[DEBUG] All clips updated to match base length.")
-
-# --- Recording Function ---
-def record_clip_player1(client, state_tracker):
-    track_to_use = state_tracker.get_next_empty_track(1)
-    if track_to_use is None:
-        print("Player 1: All designated tracks (1, 3, 5, 7) are full! Clear some clips before recording more.")
-        return
-
-    print(f"Player 1: Recording new clip in track {track_to_use + 1}, slot {state_tracker.clip_slot_index + 1}")
-    
-    # Disarm only Player 1's tracks
-    for i in [0, 2, 4, 6]:  # Player 1's designated tracks
-        client.send_message("/live/track/set/arm", [i, 0])  # Disarm Player 1's tracks
-    client.send_message("/live/track/set/arm", [track_to_use, 1])  # Arm the selected track
-    client.send_message("/live/clip_slot/fire", [track_to_use, state_tracker.clip_slot_index])
-    state_tracker.mark_track_has_clip(track_to_use, True)
-    
-    # Update the active track for Player 1
-    global current_active_track_player1
-    current_active_track_player1 = track_to_use
-    print(f"Player 1: Recording started on track {track_to_use + 1}, slot {state_tracker.clip_slot_index + 1}")
-
-def record_clip_player2(client, state_tracker):
-    track_to_use = state_tracker.get_next_empty_track(2)
-    if track_to_use is None:
-        print("Player 2: All designated tracks (2, 4, 6, 8) are full! Clear some clips before recording more.")
-        return
-
-    print(f"Player 2: Recording new clip in track {track_to_use + 1}, slot {state_tracker.clip_slot_index + 1}")
-    
-    # Disarm only Player 2's tracks
-    for i in [1, 3, 5, 7]:  # Player 2's designated tracks
-        client.send_message("/live/track/set/arm", [i, 0])  # Disarm Player 2's tracks
-    client.send_message("/live/track/set/arm", [track_to_use, 1])  # Arm the selected track
-    client.send_message("/live/clip_slot/fire", [track_to_use, state_tracker.clip_slot_index])
-    state_tracker.mark_track_has_clip(track_to_use, True)
-    
-    # Update the active track for Player 2
-    global current_active_track_player2
-    current_active_track_player2 = track_to_use
-    print(f"Player 2: Recording started on track {track_to_use + 1}, slot {state_tracker.clip_slot_index + 1}")
-
-# --- Connection and Validation Helpers ---
-def verify_ableton_connection(client, timeout=1.0):
-    print("Verifying connection to Ableton...")
-    event = threading.Event()
-    def handle_response(*args):
-        print(f"Received response from Ableton: {args}")
-        event.set()
-    global_dispatcher.map("/live/song/get/tempo", handle_response)
-    client.send_message("/live/song/get/tempo", [])
-    client.send_message("/live/test", [])
-    start_time = time.time()
-    while not event.is_set() and time.time() - start_time < timeout:
-        time.sleep(0.005)
-    global_dispatcher.unmap("/live/song/get/tempo", handle_response)
-    if event.is_set():
-        print("Successfully connected to Ableton!")
-        return True
-    else:
-        print("Could not verify connection to Ableton. Check that AbletonOSC is running.")
-        return False
-
-def check_track_has_clip(client, track_index, clip_slot_index):
-    print(f"Checking if track {track_index+1}, slot {clip_slot_index+1} has a clip...")
-    event = threading.Event()
-    result = [None]
-    def handler(unused_addr, *args):
-        if len(args) >= 3:
-            if int(args[0]) == track_index and int(args[1]) == clip_slot_index:
-                result[0] = bool(int(args[2]))
-                event.set()
-                print(f"Response: Track {track_index+1}, slot {clip_slot_index+1} has clip: {result[0]}")
-    global_dispatcher.map("/live/clip_slot/get/has_clip/return", handler)
-    global_dispatcher.map("/live/clip_slot/get/has_clip", handler)
-    global_dispatcher.map("/live/clip/get/exists/return", handler)
-    client.send_message("/live/clip_slot/get/has_clip", [track_index, clip_slot_index])
-    time.sleep(0.005)  # Increased delay to ensure message is sent
-    client.send_message("/live/clip/get/exists", [track_index, clip_slot_index])
-    start_time = time.time()
-    while not event.is_set() and time.time() - start_time < 0.5:  # Increased timeout
-        time.sleep(0.01)  # Increased polling interval
-    if result[0] is None:
-        print(f"No response received for track {track_index+1}; assuming no clip.")
-        return False
-    return result[0]
-
-def check_track_is_armed(client, track_index):
-    print(f"Checking if track {track_index+1} is armed...")
-    event = threading.Event()
-    result = [None]
-    def handler(unused_addr, *args):
-        if len(args) >= 2:
-            if int(args[0]) == track_index:
-                result[0] = bool(args[1])
-                event.set()
-                print(f"Response: Track {track_index+1} is armed: {result[0]}")
-    global_dispatcher.map("/live/track/get/arm", handler)
-    client.send_message("/live/track/get/arm", [track_index])
-    start_time = time.time()
-    while not event.is_set() and time.time() - start_time < 0.5:
-        time.sleep(0.01)
-    global_dispatcher.unmap("/live/track/get/arm", handler)
-    if result[0] is None:
-        print(f"No response received for track {track_index+1}; assuming not armed.")
-        return False
-    return result[0]
-
-def check_track_is_recording(client, track_index, clip_slot_index):
-    print(f"Checking if track {track_index+1}, slot {clip_slot_index+1} is recording...")
-    event = threading.Event()
-    result = [None]
-    def handler(unused_addr, *args):
-        if len(args) >= 3:
-            if int(args[0]) == track_index and int(args[1]) == clip_slot_index:
-                result[0] = bool(args[2])
-                event.set()
-                print(f"Response: Track {track_index+1}, slot {clip_slot_index+1} is recording: {result[0]}")
-    global_dispatcher.map("/live/clip/get/is_recording", handler)
-    client.send_message("/live/clip/get/is_recording", [track_index, clip_slot_index])
-    start_time = time.time()
-    while not event.is_set() and time.time() - start_time < 0.5:
-        time.sleep(0.01)
-    global_dispatcher.unmap("/live/clip/get/is_recording", handler)
-    if result[0] is None:
-        print(f"No response received for track {track_index+1}, slot {clip_slot_index+1}; assuming not recording.")
-        return False
-    return result[0]
-
-def check_track_is_playing(client, track_index, clip_slot_index):
-    print(f"Checking if track {track_index+1}, slot {clip_slot_index+1} is playing...")
-    event = threading.Event()
-    result = [None]
-    def handler(unused_addr, *args):
-        if len(args) >= 3:
-            if int(args[0]) == track_index and int(args[1]) == clip_slot_index:
-                result[0] = bool(args[2])
-                event.set()
-                print(f"Response: Track {track_index+1}, slot {clip_slot_index+1} is playing: {result[0]}")
-    global_dispatcher.map("/live/clip/get/is_playing", handler)
-    client.send_message("/live/clip/get/is_playing", [track_index, clip_slot_index])
-    start_time = time.time()
-    while not event.is_set() and time.time() - start_time < 0.5:
-        time.sleep(0.01)
-    global_dispatcher.unmap("/live/clip/get/is_playing", handler)
-    if result[0] is None:
-        print(f"No response received for track {track_index+1}, slot {clip_slot_index+1}; assuming not playing.")
-        return False
-    return result[0]
-
-# --- Simplified Clip Length Update Function ---
-def update_clip_lengths(client, state_tracker):
-    """
-    Periodically checks the length of the clip in track 1, slot 1,
-    and updates the lengths of the other clips to match.
-    """
-    if not state_tracker.track_has_clip[0]:  # Check if track 1 has a clip
-        print("[INFO] Track 1, slot 1 has no clip. Skipping update.")
-        return
-
-    loop_points = query_clip_loop_points(client, 0, 0)  # Get loop points for track 1, slot 1
-    if loop_points[0] is not None and loop_points[1] is not None:
-        base_clip_length = loop_points[1] - loop_points[0]
-        print(f"[INFO] Base clip length: {base_clip_length} beats")
-
-        filled_tracks = state_tracker.get_filled_tracks(1) + state_tracker.get_filled_tracks(2)
-        for track_idx in filled_tracks:
-            print(f"Updating loop points for track {track_idx+1} to match length: {base_clip_length} beats")
-            client.send_message("/live/clip/set/loop_start", [track_idx, state_tracker.clip_slot_index, 0.0])
-            client.send_message("/live/clip/set/loop_end", [track_idx, state_tracker.clip_slot_index, base_clip_length])
-    else:
-        print("[ERROR] Unable to retrieve loop points for track 1, slot 1.")
-
-# --- Main and Keyboard Handling ---
-def main():
-    global running  # Use the global flag
-    global waiting_for_refire_player1, waiting_for_refire_player2, current_active_track_player1, current_active_track_player2, all_clips_recorded
-    global client2_clients
-    start_global_osc_server()
-    state_tracker = StateTracker()  # Single StateTracker for both players
-    ip = "127.0.0.1"   # AbletonOSC sending address
-    port = 11000       # AbletonOSC sending port
-    client = udp_client.SimpleUDPClient(ip, port)
-    ip_addresses = ["192.168.1.26","192.168.1.211","192.168.1.11"]  # IP addresses for VR headsets
-    # Create clients for PC Transmitter port (9001) to send messages to headsets
-    client2_clients = [udp_client.SimpleUDPClient(ip, 9003) for ip in ip_addresses]
-    start_client2_osc_server(client, client2_clients, state_tracker)
-    
-    print(f"Attempting to connect to AbletonOSC server at {ip}:{port}")
-    if not verify_ableton_connection(client):
-        input("Press Enter to exit...")
-        return
-    
-    # Initial validation for both players
-    state_tracker.validate_state_with_ableton(client)
-    state_tracker.start_background_validation(client, ip_addresses)
-
-    print("Foot controller started. Player 1 controls")
-    print("- Press ',' to toggle recording/refiring")
-    print("- Press '.' to stop all clips (playback only)")
-    print("- Press '/' to fire scene")
-    print("- Player 2 press ; ' \ to do same thing")
-    print("- Press 's' to synchronize all clips to the same length")
-    print("- Press 'up' and 'down' for other controls (not used here)")
-    print("- Press 'esc' to exit")
-    
-    is_processing = False  # Local to main
-
-
-    def handle_comma_press(e):
-        global waiting_for_refire_player1, current_active_track_player1, is_processing_player1
-
-        print("[DEBUG] --- Comma Key Pressed ---")
-        print(f"[DEBUG] PRE: waiting_for_refire_player1={waiting_for_refire_player1}, current_active_track_player1={current_active_track_player1}, is_processing_player1={is_processing_player1}")
-        print("Player 1: Comma key pressed.")
-
-        with player1_lock:
-            if is_processing_player1:
-                print("Player 1: Already processing.")
-                return
-            is_processing_player1 = True
-
-        try:
-            if waiting_for_refire_player1:
-                print(f"Player 1: Stopping track {current_active_track_player1 + 1}")
-                client.send_message("/live/clip_slot/fire", [current_active_track_player1, state_tracker.clip_slot_index])
-                # Send to VR headsets via PC Transmitter port (9001)
-                if current_active_track_player1 == 0: 
-                    for c in client2_clients:
-                        #c.send_message("/clipisplaying", [1, current_active_track_player1, True])
-                        c.send_message("/clipisrecording", [1, current_active_track_player1, False])
-                elif current_active_track_player1 == 2: 
-                    for c in client2_clients:
-                        #c.send_message("/clipisplaying", [1, current_active_track_player1-1, True])
-                        c.send_message("/clipisrecording", [1, current_active_track_player1-1, False])
-                elif current_active_track_player1 == 4: 
-                    for c in client2_clients:
-                        #c.send_message("/clipisplaying", [1, current_active_track_player1 - 2, True])
-                        c.send_message("/clipisrecording", [1, current_active_track_player1 - 2, False])
-                elif current_active_track_player1 == 6: 
-                    for c in client2_clients:
-                        #c.send_message("/clipisplaying", [1, current_active_track_player1 - 3, True])
-                        c.send_message("/clipisrecording", [1, current_active_track_player1 - 3, False])
-                
-
-                finalized_track = current_active_track_player1
-                next_track = state_tracker.get_next_track(current_active_track_player1, 1)
-
-                # Disarm all tracks and arm the next track
-                for i in [0, 2, 4, 6]:
-                    client.send_message("/live/track/set/arm", [i, 0])
-                #client.send_message("/live/track/set/arm", [next_track, 1])
-                #print(f"Player 1: Armed next track {next_track + 1}")
-
-                with player1_lock:
-                    current_active_track_player1 = next_track
-                    waiting_for_refire_player1 = False
-                    print("[DEBUG] Player 1: Set waiting_for_refire_player1 = False")
-
-                threading.Thread(
-                target=finalize_recording,
-                args=(client, finalized_track, state_tracker.clip_slot_index, state_tracker),
-                    daemon=True
-                ).start()
-            else:
-                if current_active_track_player1 is None:
-                    current_active_track_player1 = state_tracker.get_next_empty_track(1)
-                    client.send_message("/live/track/set/arm",[8,1])
-                    if current_active_track_player1 is None:
-                        print("Player 1: No available tracks.")
-                        return
-
-                print(f"Player 1: Starting recording on track {current_active_track_player1 + 1}")
-
-                for i in [0, 2, 4, 6]:
-                    client.send_message("/live/track/set/arm", [i, 0])
-                client.send_message("/live/track/set/arm", [current_active_track_player1, 1])
-                client.send_message("/live/clip_slot/fire", [current_active_track_player1, state_tracker.clip_slot_index])
-                # Send to VR headsets via PC Transmitter port (9001)
-                if current_active_track_player1 == 0: 
-                    for c in client2_clients:
-                        c.send_message("/clipisrecording", [1, current_active_track_player1, True])
-                elif current_active_track_player1 == 2: 
-                    for c in client2_clients:
-                        c.send_message("/clipisrecording", [1, current_active_track_player1-1, True])
-                elif current_active_track_player1 == 4: 
-                    for c in client2_clients:
-                        c.send_message("/clipisrecording", [1, current_active_track_player1 - 2, True])
-                elif current_active_track_player1 == 6: 
-                    for c in client2_clients:
-                        c.send_message("/clipisrecording", [1, current_active_track_player1 - 3, True])
-
-                with player1_lock:
-                    waiting_for_refire_player1 = True
-                    print("[DEBUG] Player 1: Set waiting_for_refire_player1 = True")
-        except Exception as e:
-            print(f"ERROR in Player 1: {e}")
-            with player1_lock:
-                waiting_for_refire_player1 = False
-        finally:
-            with player1_lock:
-                is_processing_player1 = False
-                print(f"[DEBUG] POST: waiting_for_refire_player1={waiting_for_refire_player1}, current_active_track_player1={current_active_track_player1}, is_processing_player1={is_processing_player1}")
-
-    def handle_semicolon_press(e):
-        global waiting_for_refire_player2, current_active_track_player2, is_processing_player2
-        print("[DEBUG] --- Semicolon Key Pressed ---")
-        print(f"[DEBUG] PRE: waiting_for_refire_player2={waiting_for_refire_player2}, current_active_track_player2={current_active_track_player2}, is_processing_player2={is_processing_player2}")
-        print("Player 2: Semicolon key pressed.")
-
-        with player2_lock:
-            if is_processing_player2:
-                print("Player 2: Already processing.")
-                return
-            is_processing_player2 = True
-
-        try:
-            if waiting_for_refire_player2:
-                print(f"Player 2: Stopping track {current_active_track_player2 + 1}")
-                client.send_message("/live/clip_slot/fire", [current_active_track_player2, state_tracker.clip_slot_index])
-                # Send to VR headsets via PC Transmitter port (9001)
-                if current_active_track_player2 == 1: 
-                    for c in client2_clients:
-                        #c.send_message("/clipisplaying", [2, current_active_track_player2-1, True])
-                        c.send_message("/clipisrecording", [2, current_active_track_player2-1, False])
-                elif current_active_track_player2 == 3: 
-                    for c in client2_clients:
-                        #c.send_message("/clipisplaying", [2, current_active_track_player2 - 2, True])
-                        c.send_message("/clipisrecording", [2, current_active_track_player2 - 2, False])
-                elif current_active_track_player2 == 5: 
-                    for c in client2_clients:
-                        #c.send_message("/clipisplaying", [2, current_active_track_player2 - 3, True])
-                        c.send_message("/clipisrecording", [2, current_active_track_player2 - 3, False])
-                elif current_active_track_player2 == 7: 
-                    for c in client2_clients:
-                        #c.send_message("/clipisplaying", [2, current_active_track_player2 - 4, True])
-                        c.send_message("/clipisrecording", [2, current_active_track_player2 - 4, False])
-
-                finalized_track = current_active_track_player2
-                next_track = state_tracker.get_next_track(current_active_track_player2, 2)
-
-                # Disarm all tracks and arm the next track
-                for i in [1, 3, 5, 7]:
-                    client.send_message("/live/track/set/arm", [i, 0])
-                #client.send_message("/live/track/set/arm", [next_track, 1])
-                #print(f"Player 2: Armed next track {next_track + 1}")
-
-                with player2_lock:
-                    current_active_track_player2 = next_track
-                    waiting_for_refire_player2 = False
-                    print("[DEBUG] Player 2: Set waiting_for_refire_player2 = False")
-
-                threading.Thread(
-                target=finalize_recording,
-                args=(client, finalized_track, state_tracker.clip_slot_index, state_tracker),
-                    daemon=True
-                ).start()
-            else:
-                if current_active_track_player2 is None:
-                    current_active_track_player2 = state_tracker.get_next_empty_track(2)
-                    client.send_message("/live/track/set/arm",[9,1])
-
-                    if current_active_track_player2 is None:
-                        print("Player 2: No available tracks.")
-                        return
-
-                print(f"Player 2: Starting recording on track {current_active_track_player2 + 1}")
-
-                for i in [1, 3, 5, 7]:
-                    client.send_message("/live/track/set/arm", [i, 0])
-                client.send_message("/live/track/set/arm", [current_active_track_player2, 1])
-                client.send_message("/live/clip_slot/fire", [current_active_track_player2, state_tracker.clip_slot_index])
-                # Send to VR headsets via PC Transmitter port (9001)
-                if current_active_track_player2 == 1: 
-                    for c in client2_clients:
-                        c.send_message("/clipisrecording", [2, current_active_track_player2-1, True])
-                elif current_active_track_player2 == 3: 
-                    for c in client2_clients:
-                        c.send_message("/clipisrecording", [2, current_active_track_player2 - 2, True])
-                elif current_active_track_player2 == 5: 
-                    for c in client2_clients:
-                        c.send_message("/clipisrecording", [2, current_active_track_player2 - 3, True])
-                elif current_active_track_player2 == 7: 
-                    for c in client2_clients:
-                        c.send_message("/clipisrecording", [2, current_active_track_player2 - 4, True])
-
-                with player2_lock:
-                    waiting_for_refire_player2 = True
-                    print("[DEBUG] Player 2: Set waiting_for_refire_player2 = True")
-        except Exception as e:
-            print(f"ERROR in Player 2: {e}")
-            with player2_lock:
-                waiting_for_refire_player2 = False
-        finally:
-            with player2_lock:
-                is_processing_player2 = False
-                print(f"[DEBUG] POST: waiting_for_refire_player2={waiting_for_refire_player2}, current_active_track_player2={current_active_track_player2}, is_processing_player2={is_processing_player2}")
-
-    
-    def stop_program(e):
-        global running
-        print("Exiting foot controller...")
-        running = False  # Set the flag to False to stop the program
-
-    
-    ## Leave in case needs to be reimplemented
-    # def force_validation(e):
-    #     nonlocal is_processing
-    #     with threading.Lock():
-    #         if is_processing:
-    #             print("Already processing a command. Please wait...")
-    #             return
-    #         is_processing = True
-    #         try:
-    #             print("Forcing state validation with Ableton...")
-    #             validate_state_with_ableton(client, state_tracker)
-    #         finally:
-    #             is_processing = False
-    
-    def sync_all_clips(e):
-        nonlocal is_processing
-        with threading.Lock():
-            if is_processing:
-                print("Already processing a command. Please wait...")
-                return
-            is_processing = True
-            try:
-                print("Manually triggering clip synchronization...")
-                update_all_clips_loop_points(client, state_tracker)
-            finally:
-                is_processing = False
-        
-    # Fix keyboard bindings
-    keyboard.on_press_key(',', handle_comma_press)
-    keyboard.on_press_key('s', sync_all_clips)
-    keyboard.on_press_key('esc', stop_program)
-    
-    # Map the Player 2 keyboard presses
-    keyboard.on_press_key(';', handle_semicolon_press)
-    keyboard.on_press_key('.', lambda e: stop_clips(client, client2_clients))
-    keyboard.on_press_key("'", lambda e: stop_clips(client, client2_clients))
-    keyboard.on_press_key('backslash', lambda e: fire_scene(client, client2_clients, state_tracker))
-    keyboard.on_press_key('/', lambda e: fire_scene(client, client2_clients, state_tracker))
-
-    # Start periodic updates
-    def periodic_update():
-        if running:  # Check if the program should continue running
-            update_clip_lengths(client, state_tracker)
-            threading.Timer(5.0, periodic_update).start()  # Check every 5 seconds
-        else:
-            state_tracker.stop_background_validation()
-            if global_osc_server:
-                global_osc_server.shutdown()  # Shutdown the OSC server
-            if client2_osc_server:
-                client2_osc_server.shutdown()  # Shutdown the client2 OSC server
-
-    periodic_update()  # Start the periodic update
-
-    # Main loop to keep the program running
-    while running:
-        time.sleep(0.1)  # Sleep briefly to avoid busy waiting
-
-    print("Foot controller has stopped.")
-
-# Function to safely print debug info
-def debug_print_state():
-    print("\n--- CURRENT STATE ---")
-    print(f"Player 1: waiting_for_refire={waiting_for_refire_player1}, track={current_active_track_player1}, processing={is_processing_player1}")
-    print(f"Player 2: waiting_for_refire={waiting_for_refire_player2}, track={current_active_track_player2}, processing={is_processing_player2}")
-    print("--------------------\n")
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+####Issues outstanding#####
+# takes a while for the track to start up
+# if the delete from VR is implemented for single tracks, make sure you can't delete the first clip from player 1 bc it's the base clip
+ 
+from pythonosc import udp_client, dispatcher, osc_server, osc_bundle_builder, osc_message_builder
+import time
+import threading
+import socket
+import os
+import asyncio
+import sys
+import math
+import queue
+import signal
+from collections import namedtuple, OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import logging
+import metrics
+import controller_logging
+import pedal_input
+import session_store
+
+log = controller_logging.get_logger("controller")
+query_log = controller_logging.get_logger("query")
+validation_log = controller_logging.get_logger("validation")
+pedal_log = controller_logging.get_logger("pedals")
+headset_log = controller_logging.get_logger("headset")
+sync_log = controller_logging.get_logger("sync")
+
+# Global OSC dispatcher and server for receiving Ableton responses on port 11001 and from client 2 on client2_port
+global_dispatcher = dispatcher.Dispatcher()
+global_osc_server = None
+client2_dispatcher = dispatcher.Dispatcher()
+client2_osc_server = None
+
+# --- Player / Track Layout ---
+# One config drives the tracker, the record handlers, /toggletrack and the headset arrays.
+LAYOUT_CONFIG = {
+    "num_players": 2,
+    "tracks_per_player": 4,
+    "allocation": "interleaved",  # "interleaved": P1 gets 1, 3, 5, 7 / P2 gets 2, 4, 6, 8. "block": P1 gets 1-4, P2 gets 5-8.
+    "slots_per_track": 3,  # Clip slots per track, i.e. the number of scenes the players can loop in.
+}
+
+# Pedal keys per player. Players without an entry have no keyboard bindings.
+PLAYER_KEYS = {
+    1: {"record": ",", "stop": ".", "fire": "/"},
+    2: {"record": ";", "stop": "'", "fire": "backslash"},
+}
+
+# Where pedal presses come from: "keyboard", "evdev", "midi" or "osc" (override with --input <backend>).
+# Bindings map an input to (player, action): "record", "stop" or "fire" for a player,
+# or player None for the controller-wide "sync", "metrics", "scene_up", "scene_down" and "exit".
+INPUT_CONFIG = {
+    "backend": "keyboard",
+    "keyboard": {
+        "bindings": {
+            **{keys[action]: (player, action) for player, keys in PLAYER_KEYS.items() for action in keys},
+            "s": (None, "sync"),
+            "m": (None, "metrics"),
+            "up": (None, "scene_up"),
+            "down": (None, "scene_down"),
+            "esc": (None, "exit"),
+        },
+    },
+    "evdev": {
+        "device": None,  # e.g. "/dev/input/by-id/usb-PCsensor_FootSwitch-event-kbd"; None finds one by name
+        "name_contains": "pedal",
+        "grab": True,
+        "bindings": {
+            "KEY_A": (1, "record"), "KEY_B": (1, "stop"), "KEY_C": (1, "fire"),
+            "KEY_D": (2, "record"), "KEY_E": (2, "stop"), "KEY_F": (2, "fire"),
+            "KEY_S": (None, "sync"), "KEY_M": (None, "metrics"),
+            "KEY_UP": (None, "scene_up"), "KEY_DOWN": (None, "scene_down"), "KEY_ESC": (None, "exit"),
+        },
+    },
+    "midi": {
+        "port": None,  # Substring of the MIDI input port name; None uses the first port
+        "bindings": {
+            ("control_change", 80): (1, "record"), ("control_change", 81): (1, "stop"), ("control_change", 82): (1, "fire"),
+            ("control_change", 83): (2, "record"), ("control_change", 84): (2, "stop"), ("control_change", 85): (2, "fire"),
+            ("control_change", 86): (None, "sync"), ("control_change", 87): (None, "metrics"),
+            ("control_change", 88): (None, "scene_up"), ("control_change", 89): (None, "scene_down"),
+            ("control_change", 90): (None, "exit"),
+        },
+    },
+    "osc": {"host": "127.0.0.1", "port": 12001},
+}
+
+class TrackLayout:
+    """
+    Maps players to Ableton tracks. Every lookup is a precomputed dict or
+    bitmask, so it stays O(1) however many players and tracks there are.
+    """
+    def __init__(self, num_players=2, tracks_per_player=4, allocation="interleaved", slots_per_track=3):
+        if allocation not in ("interleaved", "block"):
+            raise ValueError(f"Unknown track allocation: {allocation}")
+        self.num_players = num_players
+        self.tracks_per_player = tracks_per_player
+        self.allocation = allocation
+        self.slots_per_track = slots_per_track
+        self.num_tracks = num_players * tracks_per_player
+        self.players = list(range(1, num_players + 1))
+        self.player_tracks = {}  # player -> Ableton track indices in recording order
+        self.track_owner = {}    # Ableton track index -> (player, position within that player's tracks)
+        self.player_masks = {}   # player -> bitmask of that player's tracks
+        for player in self.players:
+            tracks = [self._track_index(player, position) for position in range(tracks_per_player)]
+            self.player_tracks[player] = tracks
+            self.player_masks[player] = sum(1 << t for t in tracks)
+            for position, track in enumerate(tracks):
+                self.track_owner[track] = (player, position)
+        self.all_tracks_mask = (1 << self.num_tracks) - 1
+
+    def _track_index(self, player, position):
+        if self.allocation == "interleaved":
+            return position * self.num_players + (player - 1)
+        return (player - 1) * self.tracks_per_player + position
+
+    def track_for(self, player, position):
+        """
+        Returns the Ableton track for a player's 0-based track position, or None if out of range.
+        """
+        tracks = self.player_tracks.get(player)
+        if tracks is None or not 0 <= position < len(tracks):
+            return None
+        return tracks[position]
+
+    def player_for_track(self, track_index):
+        return self.track_owner.get(track_index, (None, None))[0]
+
+    def position_of(self, track_index):
+        return self.track_owner.get(track_index, (None, None))[1]
+
+    def next_track(self, track_index):
+        """
+        Returns the owning player's next track, wrapping around to their first.
+        """
+        player, position = self.track_owner[track_index]
+        return self.player_tracks[player][(position + 1) % self.tracks_per_player]
+
+    def input_track(self, player):
+        # Each player's input/monitor track sits after the looper tracks (tracks 9 and 10 by default).
+        return self.num_tracks + player - 1
+
+    def describe(self, player):
+        return ", ".join(str(t + 1) for t in self.player_tracks[player])
+
+layout = TrackLayout(**LAYOUT_CONFIG)
+
+class PlayerState:
+    """
+    Per-player toggling state for the record pedal. Only that player's
+    PedalWorker drives the state machine; other threads just read or reset it.
+    """
+    def __init__(self, player):
+        self.player = player
+        self.waiting_for_refire = False  # False = idle, True = recording and waiting for the stop press
+        self.current_active_track = None
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.waiting_for_refire = False
+            self.current_active_track = None
+
+player_states = {player: PlayerState(player) for player in layout.players}
+pedal_workers = {}  # player -> PedalWorker, started in main(); None -> GlobalActionWorker
+
+base_clip_length = None  # Holds the length (in beats) of the first recorded clip in the active scene.
+scene_base_lengths = {}  # Scene -> base_clip_length, for the scenes that are not active.
+all_clips_recorded = False   # Flag to indicate when all clips have been recorded
+
+# Global flag to control the running state
+running = True
+
+client = None  # global client variable
+headsets = None  # HeadsetTransport for the VR headsets, created in main()
+
+# --- OSC Command Bundles ---
+use_osc_bundles = True  # Set False to send grouped commands as separate messages (e.g. AbletonOSC builds without bundle support).
+MAX_BUNDLE_BYTES = 8192  # Larger groups are split across several bundles.
+
+class CommandBatch:
+    """
+    Collects a group of Ableton commands (disarm/arm/fire, a scene's worth of
+    fires, a round of loop point writes) and sends them as one OSC bundle, so
+    they go out in one datagram and Ableton applies them in the same tick.
+    """
+    def __init__(self, timetag=None):
+        self.messages = []
+        # Seconds since the epoch for a timestamped bundle, or None for "immediately".
+        self.timetag = timetag
+
+    def add(self, address, args):
+        self.messages.append((address, list(args)))
+        return self
+
+    def __len__(self):
+        return len(self.messages)
+
+    def send(self, client, as_bundle=None):
+        if not self.messages:
+            return
+        if as_bundle is None:
+            as_bundle = use_osc_bundles
+        if not as_bundle or len(self.messages) == 1:
+            for address, args in self.messages:
+                client.send_message(address, args)
+            return
+        for bundle in self._build_bundles():
+            client.send(bundle)
+
+    def _build_bundles(self):
+        timetag = self.timetag if self.timetag is not None else osc_bundle_builder.IMMEDIATELY
+        bundles = []
+        builder = osc_bundle_builder.OscBundleBuilder(timetag)
+        size = 16  # "#bundle" header plus the timetag
+        count = 0
+        for address, args in self.messages:
+            message = osc_message_cache.get(address, args)
+            message_size = 4 + len(message.dgram)
+            if count and size + message_size > MAX_BUNDLE_BYTES:
+                bundles.append(builder.build())
+                builder = osc_bundle_builder.OscBundleBuilder(timetag)
+                size, count = 16, 0
+            builder.add_content(message)
+            size += message_size
+            count += 1
+        bundles.append(builder.build())
+        return bundles
+
+def build_osc_message(address, args):
+    builder = osc_message_builder.OscMessageBuilder(address=address)
+    for arg in args:
+        builder.add_arg(arg)
+    return builder.build()
+
+# --- OSC Message Cache ---
+class OSCMessageCache:
+    """
+    LRU cache of built OscMessages keyed by (address, args). The hot paths
+    resend a small set of messages (arm/disarm, slot fires, /clipisrecording,
+    the /VROSC arrays), so most sends reuse an already encoded datagram.
+    """
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(address, args):
+        # Arg types are part of the key: True == 1 but encodes as a bool, not an int.
+        return (address, tuple((type(arg), arg) for arg in args))
+
+    def get(self, address, args):
+        if not isinstance(args, (list, tuple)):
+            args = [args]
+        try:
+            key = self.key(address, args)
+            hash(key)
+        except TypeError:  # Unhashable args (nested lists) bypass the cache
+            return build_osc_message(address, args)
+        with self.lock:
+            message = self.entries.get(key)
+            if message is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return message
+            self.misses += 1
+        message = build_osc_message(address, args)
+        with self.lock:
+            self.entries[key] = message
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return message
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return f"{len(self.entries)}/{self.maxsize} entries, {self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate)"
+
+osc_message_cache = OSCMessageCache()
+
+class CachedUDPClient(udp_client.SimpleUDPClient):
+    """
+    SimpleUDPClient that sends messages from osc_message_cache instead of
+    building a new one for every send.
+    """
+    def send_message(self, address, value):
+        self.send(osc_message_cache.get(address, value))
+
+# --- Headset Transport ---
+# Where headset updates go. Headsets are learned from the messages they send to the client2
+# server (port 12000), or from a /hello handshake; "addresses" only seeds the registry at startup.
+# Set "multicast_group" (e.g. "239.255.0.1") to send one datagram to every headset that joined
+# the group instead of one datagram per address.
+HEADSET_TRANSPORT_CONFIG = {
+    "port": 9003,  # PC Transmitter port the headsets listen on
+    "addresses": ["192.168.1.26", "192.168.1.211", "192.168.1.11"],
+    "multicast_group": None,
+    "multicast_ttl": 1,
+    "peer_timeout": 30.0,  # Seconds without a message before a headset is dropped (kept once a configured one has spoken)
+}
+
+class HeadsetTransport:
+    """
+    Fans OSC out to every VR headset from one socket. Each message is encoded
+    once and the same bytes are sent to every destination (or once to the
+    multicast group), so broadcast cost stays flat as headsets are added.
+
+    Also the headset registry: peers maps each headset's (ip, port) to the last
+    time we heard from it. Headsets silent for peer_timeout are evicted so
+    offline headsets stop costing send time. A configured address that has
+    been heard from at least once is never evicted, since headsets only send
+    on user action and have no heartbeat of their own; one that never spoke
+    ages out like any other peer.
+    """
+    def __init__(self, addresses, port, multicast_group=None, multicast_ttl=1, peer_timeout=30.0):
+        self.port = port
+        self.multicast_group = multicast_group
+        self.peer_timeout = peer_timeout
+        self.lock = threading.Lock()
+        now = time.monotonic()
+        self.seeds = {(ip, port) for ip in addresses}
+        self.heard_seeds = set()  # Configured addresses that have sent us something
+        self.peers = {seed: now for seed in self.seeds}  # Seeds get one peer_timeout to say hello
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if multicast_group:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, multicast_ttl)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["addresses"], config["port"], config.get("multicast_group"),
+                   config.get("multicast_ttl", 1), config.get("peer_timeout", 30.0))
+
+    @property
+    def destinations(self):
+        with self.lock:
+            return list(self.peers)
+
+    def seen(self, ip, port=None):
+        """
+        Records a message from a headset. Returns True if it is a new (or
+        previously evicted) peer that needs a full state snapshot.
+        """
+        destination = (ip, port or self.port)
+        with self.lock:
+            joined = destination not in self.peers
+            self.peers[destination] = time.monotonic()
+            if destination in self.seeds:
+                self.heard_seeds.add(destination)
+        if joined:
+            headset_log.info("Headset joined: %s:%s", destination[0], destination[1])
+        return joined
+
+    def evict_stale(self):
+        cutoff = time.monotonic() - self.peer_timeout
+        with self.lock:
+            stale = [destination for destination, last_seen in self.peers.items()
+                     if last_seen < cutoff and destination not in self.heard_seeds]
+            for destination in stale:
+                del self.peers[destination]
+        for destination in stale:
+            headset_log.info("Headset timed out: %s:%s", destination[0], destination[1])
+        return stale
+
+    def targets(self):
+        if self.multicast_group:
+            return [(self.multicast_group, self.port)]
+        self.evict_stale()
+        return self.destinations
+
+    def send_message(self, address, args, destinations=None):
+        self.send_dgram(osc_message_cache.get(address, args).dgram, destinations)
+
+    def send_dgram(self, dgram, destinations=None):
+        for destination in (self.targets() if destinations is None else destinations):
+            try:
+                self.sock.sendto(dgram, destination)
+            except OSError as e:
+                headset_log.warning("Failed to send to headset %s:%s: %s", destination[0], destination[1], e)
+
+    def close(self):
+        self.sock.close()
+
+def fire_scene(client, headsets, state_tracker, e=None, scene=None):
+    scene = state_tracker.clip_slot_index if scene is None else scene
+    # Send to VR headsets via PC Transmitter port (9001)
+    headsets.send_message("/pcplayall", [True])
+    if not state_tracker.snapshot.armed:
+        # Nothing is recording, so Live can launch the whole scene from one message. Empty slots on armed
+        # tracks (the players' input tracks) only record if "Start Recording on Scene Launch" is enabled in
+        # Live's preferences, which it is not by default.
+        log.info("Firing scene %s", scene + 1)
+        client.send_message("/live/scene/fire", [scene])
+        return
+    log.info("Firing scene %s (only unarmed tracks)", scene + 1)
+    # One bundle so every track starts on the same tick
+    batch = CommandBatch()
+    for i in range(state_tracker.num_tracks):
+        if not state_tracker.get_track_is_armed(i):
+            batch.add("/live/clip_slot/fire", [i, scene])
+    batch.send(client)
+
+def stop_clips(client, headsets, e=None):
+    log.info("Stopping all clips (playback only)...")
+    # Send to VR headsets via PC Transmitter port (9001)
+    headsets.send_message("/pcplayall", [False])
+    client.send_message("/live/song/stop_all_clips", [])
+
+def delete_scene(client, headsets, state_tracker, e=None):
+    """
+    Deletes every looper clip in the active scene; other scenes keep theirs.
+    """
+    global base_clip_length
+    scene = state_tracker.clip_slot_index
+    log.info("Deleting scene %s", scene + 1)
+    headsets.send_message("/deleteall", [True])
+    batch = CommandBatch()
+    for i in range(state_tracker.num_tracks):
+        batch.add("/live/clip_slot/delete_clip", [i, scene])
+    batch.send(client)
+    # Reset the scene's state
+    base_clip_length = None
+    transport_clock.reset_takes()
+    loop_point_cache.clear()
+    clip_length_reconciler.reset()
+    for player_state in player_states.values():
+        player_state.reset()
+    state_tracker.reset(scene)
+    session_file.request()
+
+def select_scene(client, headsets, state_tracker, scene):
+    """
+    Makes scene the one that recording, firing, deleting and the headset
+    arrays work on. Every scene's state is already tracked, so nothing needs
+    revalidating; only the base clip length and record cursors change over.
+    Refused while a take is running, since its stop must go to the same slot.
+    Returns True if the scene changed.
+    """
+    global base_clip_length
+    scene %= state_tracker.num_scenes
+    previous = state_tracker.clip_slot_index
+    if scene == previous:
+        return False
+    if state_tracker.snapshot.recording or any(p.waiting_for_refire for p in player_states.values()):
+        log.warning("Finish the current take before switching to scene %s.", scene + 1)
+        return False
+    scene_base_lengths[previous] = base_clip_length
+    base_clip_length = scene_base_lengths.pop(scene, None)
+    for player_state in player_states.values():
+        player_state.reset()
+    transport_clock.reset_takes()
+    state_tracker.set_active_scene(scene)
+    clip_length_reconciler.reset()
+    log.info("Scene %s of %s selected (base clip length: %s).", scene + 1, state_tracker.num_scenes, base_clip_length)
+    state_tracker.send_full_clip_state_update(headsets)
+    session_file.request()
+    return True
+
+def handle_toggletrack(client, state_tracker, addr, *args):
+    # args should contain [player, track, state] and optionally the scene (active scene if left out)
+    received_at = time.perf_counter()
+    if len(args) < 3:
+        headset_log.warning("Malformed message: %s", args)
+        return
+    
+    player = int(args[0])
+    track = int(args[1])
+    state = args[2]  # boolean value
+    scene = int(args[3]) if len(args) > 3 else state_tracker.clip_slot_index
+    if not 0 <= scene < state_tracker.num_scenes:
+        headset_log.warning("Unknown scene: %s", scene)
+        return
+
+    # Map to Ableton track index
+    track_id = layout.track_for(player, track - 1)
+    if track_id is None:
+        headset_log.warning("Unknown player/track: %s/%s", player, track)
+        return
+
+    headset_log.info("Player %s, Track %s (Ableton track %s), Scene %s, State: %s", player, track, track_id, scene + 1, state)
+
+    if state:
+        # Fire (play) the clip in the scene's slot
+        client.send_message("/live/clip_slot/fire", [track_id, scene])
+        # headsets.send_message("/clipisplaying", [player, track-1, state])
+    else:
+        # Stop the clip in the scene's slot
+        client.send_message("/live/clip/stop", [track_id, scene])
+        # headsets.send_message("/clipisplaying", [player, track-1, state])
+    metrics.record("headset.toggletrack", time.perf_counter() - received_at)
+                            
+def start_global_osc_server():
+    global global_osc_server
+    ip = "127.0.0.1"
+    port = 11001  # Fixed port for receiving from Ableton.
+    # One thread, so pushes are applied in the order they arrive; none of the handlers block.
+    global_osc_server = osc_server.BlockingOSCUDPServer((ip, port), global_dispatcher)
+    thread = threading.Thread(target=global_osc_server.serve_forever, daemon=True)
+    thread.start()
+    log.info("Global OSC server started on %s:%s", ip, port)
+    return thread
+
+
+def headset_seen(headsets, state_tracker, ip, port=None):
+    """
+    Registers a message from a headset and syncs it straight away if it just joined.
+    """
+    if headsets.seen(ip, port):
+        destination = (ip, port or headsets.port)
+        state_tracker.send_full_clip_state_update(headsets, force=True,
+                                                  destinations=None if headsets.multicast_group else [destination])
+        session_file.request()
+
+def build_client2_dispatcher(client, headsets, state_tracker):
+    osc_dispatcher = dispatcher.Dispatcher()
+
+    def map_headset(address, handler):
+        # Every headset message doubles as a heartbeat for the registry.
+        def handle(client_address, addr, *args):
+            headset_seen(headsets, state_tracker, client_address[0])
+            handler(addr, *args)
+        osc_dispatcher.map(address, handle, needs_reply_address=True)
+
+    # Handle messages from VR headsets
+    map_headset("/playall", lambda addr, *args: fire_scene(client, headsets, state_tracker) if args[0] else stop_clips(client, headsets, None))
+    map_headset("/deleteall", lambda addr, *args: delete_scene(client, headsets, state_tracker, None))
+    map_headset("/toggletrack", lambda addr, *args: handle_toggletrack(client, state_tracker, addr, *args))
+    map_headset("/selectscene", lambda addr, *args: select_scene(client, headsets, state_tracker, int(args[0])) if args else None)
+    # Handshake/heartbeat: /hello [optional port the headset listens on]
+    osc_dispatcher.map("/hello", lambda client_address, addr, *args: headset_seen(
+        headsets, state_tracker, client_address[0], int(args[0]) if args else None), needs_reply_address=True)
+    # Local latency query (not a headset message): replies to the sender with one
+    # /metrics [name, count, p50_ms, p95_ms, p99_ms, max_ms] per metric.
+    osc_dispatcher.map("/metrics", lambda client_address, addr, *args: send_metrics(headsets, client_address), needs_reply_address=True)
+    return osc_dispatcher
+
+def send_metrics(headsets, reply_address):
+    for name, (count, p50, p95, p99, max_ms) in metrics.summary().items():
+        headsets.send_message("/metrics", [name, count, float(p50), float(p95), float(p99), float(max_ms)], [reply_address])
+
+def start_client2_osc_server(client, headsets, state_tracker):
+    global client2_osc_server, client2_dispatcher
+    client2_ip = "0.0.0.0"
+    client2_port = 12000  # PC Receiver port to receive messages from headsets
+
+    # Only create if not already running
+    if client2_osc_server is not None:
+        log.warning("Client2 OSC server already running on %s:%s", client2_ip, client2_port)
+        return
+
+    client2_dispatcher = build_client2_dispatcher(client, headsets, state_tracker)
+    client2_osc_server = osc_server.ThreadingOSCUDPServer((client2_ip, client2_port), client2_dispatcher)
+    thread = threading.Thread(target=client2_osc_server.serve_forever, daemon=True)
+    thread.start()
+    log.info("Client2 OSC server started on %s:%s", client2_ip, client2_port)
+    return thread
+
+# --- State Tracking ---
+class TrackSnapshot(namedtuple("TrackSnapshot", ["has_clip", "armed", "recording", "playing", "version"])):
+    """
+    Immutable view of every track's state. Each field is a bitmask where bit i
+    is track i, so comparing or copying a whole snapshot is a few int operations.
+    """
+    __slots__ = ()
+
+    def same_state(self, other):
+        return other is not None and self[:4] == other[:4]
+
+    def is_set(self, field, track_index):
+        return (getattr(self, field) >> track_index) & 1 == 1
+
+    def as_list(self, field, num_tracks):
+        mask = getattr(self, field)
+        return [(mask >> i) & 1 for i in range(num_tracks)]
+
+TRACK_FIELDS = ("has_clip", "armed", "recording", "playing")
+
+def tracks_in_mask(mask):
+    """
+    Returns the track indices whose bits are set in mask, lowest first.
+    """
+    tracks = []
+    while mask:
+        low_bit = mask & -mask
+        tracks.append(low_bit.bit_length() - 1)
+        mask ^= low_bit
+    return tracks
+
+CLIP_LISTEN_PROPS = ("is_playing", "is_recording", "loop_start", "loop_end")
+
+class StateTracker:
+    """
+    Track state for every scene (clip slot row). Each scene has its own
+    TrackSnapshot, kept current by listeners and validation whether or not it
+    is active; self.snapshot is the active scene's, and clip_slot_index is the
+    active scene, which recording, finalizing and loop point sync target.
+    Arm state belongs to the track, so it is the same in every scene.
+    """
+    __slots__ = (
+        "layout", "num_tracks", "num_scenes", "player_masks", "scene_snapshots", "snapshot", "changes", "clip_slot_index",
+        "validation_interval", "batch_validation", "validation_timeout",
+        "use_listeners", "listeners_active", "listener_client", "reconcile_interval",
+        "clip_loop_points", "last_sent", "keepalive_interval", "suppressed_sends", "send_lock",
+        "broadcast_delay", "broadcast_pending", "coalesced_pushes",
+        "validation_running", "validation_thread", "lock", "state_changed",
+    )
+
+    def __init__(self, track_layout=None):
+        self.layout = track_layout or layout
+        self.num_tracks = self.layout.num_tracks
+        # Designated tracks per player, e.g. Player 1 (1, 3, 5, 7) and Player 2 (2, 4, 6, 8)
+        self.player_masks = self.layout.player_masks
+        self.num_scenes = self.layout.slots_per_track
+        # Readers take self.snapshot without locking; writers publish a new one under self.lock.
+        self.scene_snapshots = [TrackSnapshot(0, 0, 0, 0, 0) for _ in range(self.num_scenes)]
+        self.snapshot = self.scene_snapshots[0]
+        self.changes = 0  # Bumped by every published change in any scene and by scene switches.
+        self.clip_slot_index = 0  # Active scene.
+        self.validation_interval = 1.0  #7.0 worked but the faster the better # For background validation.
+        self.batch_validation = True  # Fire all track queries at once instead of one track at a time.
+        self.validation_timeout = 0.5  # Single deadline for a whole batch validation pass.
+        self.use_listeners = True  # Let AbletonOSC push state changes instead of polling for them.
+        self.listeners_active = False
+        self.listener_client = None
+        self.reconcile_interval = 10.0  # Slow polling fallback once listeners are active.
+        self.clip_loop_points = {}  # (track, scene, field) -> last loop_start/loop_end pushed by Ableton.
+        self.last_sent = {}  # Headset (ip, port) -> (changes, arrays last sent, last full resync time)
+        self.keepalive_interval = 10.0  # Full resync to every headset at least this often.
+        self.suppressed_sends = 0  # Headset messages skipped because nothing changed.
+        self.send_lock = threading.Lock()
+        self.broadcast_delay = 0.005  # Pushes within this many seconds of the first go out as one headset update.
+        self.broadcast_pending = False
+        self.coalesced_pushes = 0  # Pushes folded into an update that was already scheduled.
+        self.validation_running = False
+        self.validation_thread = None
+        self.lock = threading.Lock()
+        self.state_changed = threading.Condition(self.lock)  # Notified whenever a new snapshot is published.
+
+    def _publish(self, scene, snapshot):
+        # Caller holds self.lock.
+        self.changes += 1
+        snapshot = snapshot._replace(version=self.changes)
+        self.scene_snapshots[scene] = snapshot
+        if scene == self.clip_slot_index:
+            self.snapshot = snapshot
+        self.state_changed.notify_all()
+
+    def _set_bit(self, field, track_index, value, scene=None):
+        """
+        Sets one track's bit in field for scene (the active one by default;
+        arm state in every scene) and publishes a new snapshot.
+        Returns True if the value actually changed.
+        """
+        if not 0 <= track_index < self.num_tracks:
+            return False
+        bit = 1 << track_index
+        changed = False
+        with self.lock:
+            scenes = range(self.num_scenes) if field == "armed" else [self.clip_slot_index if scene is None else scene]
+            for target in scenes:
+                current = self.scene_snapshots[target]
+                mask = getattr(current, field)
+                new_mask = mask | bit if value else mask & ~bit
+                if new_mask != mask:
+                    self._publish(target, current._replace(**{field: new_mask}))
+                    changed = True
+        if changed and field in ("has_clip", "recording"):
+            clip_length_reconciler.request()
+        return changed
+
+    def set_active_scene(self, scene):
+        with self.lock:
+            self.clip_slot_index = scene
+            self.snapshot = self.scene_snapshots[scene]
+            self.changes += 1
+            self.state_changed.notify_all()
+
+    def state_grid(self, field):
+        """
+        field for every scene as one bitmap laid out like get_clip_presence_grid().
+        """
+        grid = 0
+        for scene, snapshot in enumerate(self.scene_snapshots):
+            grid |= getattr(snapshot, field) << (scene * self.num_tracks)
+        return grid
+
+    def wait_for(self, predicate, timeout):
+        """
+        Blocks until predicate(snapshot) is true or the timeout passes.
+        Returns the final predicate result.
+        """
+        with self.state_changed:
+            return self.state_changed.wait_for(lambda: predicate(self.snapshot), timeout)
+
+    async def wait_for_async(self, predicate, timeout):
+        """
+        Awaitable wait_for() for the asyncio core. The wait runs on an executor
+        thread, so the loop stays free to handle the pushes that end it.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.wait_for, predicate, timeout)
+
+    def mark_track_has_clip(self, track_index, has_clip=True):
+        if 0 <= track_index < self.num_tracks:
+            self._set_bit("has_clip", track_index, has_clip)
+            validation_log.debug("Internal state updated: Track %s has clip: %s", track_index+1, has_clip)
+
+    def mark_track_is_armed(self, track_index, is_armed):
+        if 0 <= track_index < self.num_tracks:
+            self._set_bit("armed", track_index, is_armed)
+            validation_log.debug("Internal state updated: Track %s is armed: %s", track_index+1, is_armed)
+
+    def get_track_has_clip(self, track_index):
+        return self.snapshot.is_set("has_clip", track_index)
+
+    def get_track_is_armed(self, track_index):
+        return self.snapshot.is_set("armed", track_index)
+    
+    def get_next_empty_track(self, player):
+        free = self.player_masks.get(player, 0) & ~self.snapshot.has_clip
+        if not free:
+            return None
+        return (free & -free).bit_length() - 1
+    
+    def get_filled_tracks(self, player):
+        return tracks_in_mask(self.player_masks.get(player, 0) & self.snapshot.has_clip)
+    
+    def get_empty_tracks(self, player):
+        return tracks_in_mask(self.player_masks.get(player, 0) & ~self.snapshot.has_clip)
+    
+    def are_all_tracks_filled(self, player):
+        mask = self.player_masks.get(player, 0)
+        return self.snapshot.has_clip & mask == mask
+
+    def get_all_filled_tracks(self):
+        return tracks_in_mask(self.layout.all_tracks_mask & self.snapshot.has_clip)
+
+    def any_player_tracks_filled(self):
+        """
+        True once any one player has a clip on every one of their tracks.
+        """
+        has_clip = self.snapshot.has_clip
+        return any(has_clip & mask == mask for mask in self.player_masks.values())
+    
+    def start_background_validation(self, client, ip_addresses):
+        if self.validation_thread is not None and self.validation_thread.is_alive():
+            validation_log.warning("Background validation already running")
+            return
+        self.validation_running = True
+        self.validation_thread = threading.Thread(
+            target=self._background_validation_loop,
+            args=(client, ip_addresses),
+            daemon=True
+        )
+        self.validation_thread.start()
+        validation_log.info("Background validation started (every %s seconds)", self.validation_interval)
+    
+    def stop_background_validation(self):
+        self.validation_running = False
+        if self.validation_thread:
+            self.validation_thread.join(timeout=1.0)
+            validation_log.info("Background validation stopped")
+    
+    def _background_validation_loop(self, client, ip_addresses):
+        validation_log.info("Background validation thread started")
+        while self.validation_running:
+            interval = self.reconcile_interval if self.listeners_active else self.validation_interval
+            for _ in range(int(interval * 2)):
+                if not self.validation_running:
+                    break
+                time.sleep(0.5)
+            if not self.validation_running:
+                break
+            try:
+                validation_log.debug("=== Background validation running ===")
+                self.validate_state_with_ableton(client)
+                validation_log.debug("=== Background validation complete ===")
+            except Exception as e:
+                validation_log.error("Error in background validation: %s", e)
+
+    def validate_state_with_ableton(self, client):
+        validation_log.debug("Validating internal clip state with Ableton...")
+        with metrics.timed("validation.pass"):
+            if self.batch_validation:
+                self._validate_state_batch(client)
+            else:
+                self._validate_state_serial(client)
+
+        self.send_full_clip_state_update(headsets)
+
+    def _validate_state_serial(self, client):
+        for track_idx in range(self.num_tracks):  # Check every looper track
+            has_clip = check_track_has_clip(client, track_idx, self.clip_slot_index)
+            self.mark_track_has_clip(track_idx, has_clip)
+            is_armed = check_track_is_armed(client, track_idx)
+            self.mark_track_is_armed(track_idx, is_armed)
+            is_recording = check_track_is_recording(client, track_idx, self.clip_slot_index)
+            self.mark_track_is_recording(track_idx, is_recording)
+            is_playing = check_track_is_playing(client, track_idx, self.clip_slot_index)
+            self.mark_track_is_playing(track_idx, is_playing)
+
+            filled_tracks = [t + 1 for p in self.layout.players for t in self.get_filled_tracks(p)]
+            empty_tracks = [t + 1 for p in self.layout.players for t in self.get_empty_tracks(p)]
+            validation_log.debug("Current state - Tracks with clips: %s", filled_tracks if filled_tracks else 'none')
+            validation_log.debug("Current state - Empty tracks: %s", empty_tracks if empty_tracks else 'none')
+            validation_log.debug("Current state - Armed tracks: %s", [i+1 for i in tracks_in_mask(self.snapshot.armed)])
+            validation_log.debug("Current state - Recording tracks: %s", [i+1 for i in tracks_in_mask(self.snapshot.recording)])
+
+    def validation_requests(self):
+        """
+        Returns the (field, scene, track, address, key_args) queries that make up
+        one validation pass over every scene. Arm state has no scene (None).
+        Ableton never answers clip getters on an empty slot, so is_recording and
+        is_playing are only asked where we already know of a clip; a clip that
+        appeared since is picked up by the next pass (or its listener push).
+        """
+        requests = []
+        for track_idx in range(self.num_tracks):
+            requests.append(("armed", None, track_idx, "/live/track/get/arm", [track_idx]))
+            for scene in range(self.num_scenes):
+                requests.append(("has_clip", scene, track_idx, "/live/clip_slot/get/has_clip", [track_idx, scene]))
+                if self.scene_snapshots[scene].is_set("has_clip", track_idx):
+                    requests.append(("recording", scene, track_idx, "/live/clip/get/is_recording", [track_idx, scene]))
+                    requests.append(("playing", scene, track_idx, "/live/clip/get/is_playing", [track_idx, scene]))
+        return requests
+
+    def _validate_state_batch(self, client):
+        """
+        Fires every track query (up to 80 for 8 tracks in 3 scenes) up front, collects the replies against one deadline
+        and applies the result to the tracker in a single step.
+        """
+        requests = self.validation_requests()
+        osc_requests = [(address, key_args) for _, _, _, address, key_args in requests]
+        futures = query_engine.submit_many(client, osc_requests)
+        values = query_engine.wait_all(osc_requests, futures, self.validation_timeout)
+        self._apply_validation_results(requests, values)
+
+    async def validate_state_async(self, client):
+        """
+        Batch validation pass for the asyncio core.
+        """
+        validation_log.debug("Validating internal clip state with Ableton...")
+        started = time.perf_counter()
+        requests = self.validation_requests()
+        osc_requests = [(address, key_args) for _, _, _, address, key_args in requests]
+        futures = query_engine.submit_many(client, osc_requests)
+        values = await query_engine.wait_all_async(osc_requests, futures, self.validation_timeout)
+        self._apply_validation_results(requests, values)
+        metrics.record("validation.pass", time.perf_counter() - started)
+        self.send_full_clip_state_update(headsets)
+
+    async def run_validation_async(self, client):
+        """
+        Coroutine replacement for the background validation thread.
+        """
+        while running:
+            interval = self.reconcile_interval if self.listeners_active else self.validation_interval
+            await asyncio.sleep(interval)
+            try:
+                await self.validate_state_async(client)
+            except Exception as e:
+                validation_log.error("Error in background validation: %s", e)
+
+    def _apply_validation_results(self, requests, values):
+        scenes = {scene: {} for scene in range(self.num_scenes)}
+        received = 0
+        for (field, scene, track_idx, _, _), value in zip(requests, values):
+            if value is not None:
+                received += 1
+                for target in (scenes if scene is None else [scene]):
+                    scenes[target][(field, track_idx)] = bool(int(value))
+                if field == "has_clip" and not bool(int(value)):
+                    # An empty slot can't be playing or recording.
+                    scenes[scene][("recording", track_idx)] = scenes[scene][("playing", track_idx)] = False
+        missed = len(requests) - received
+        if missed:
+            validation_log.debug("Batch validation: %s of %s queries timed out; keeping previous values.", missed, len(requests))
+        self.apply_snapshot(scenes)
+
+    def apply_snapshot(self, scenes):
+        """
+        Applies {scene: {(field, track): value}} from a validation pass, one new
+        snapshot per scene, so readers never see a half-updated state.
+        """
+        presence_changed = False
+        with self.lock:
+            for scene, snapshot in scenes.items():
+                current = self.scene_snapshots[scene]
+                masks = {field: getattr(current, field) for field in TRACK_FIELDS}
+                for (field, track_idx), value in snapshot.items():
+                    bit = 1 << track_idx
+                    masks[field] = masks[field] | bit if value else masks[field] & ~bit
+                updated = current._replace(**masks)
+                if not updated.same_state(current):
+                    self._publish(scene, updated)
+                    presence_changed |= (updated.has_clip, updated.recording) != (current.has_clip, current.recording)
+            current = self.snapshot
+        if presence_changed:
+            clip_length_reconciler.request()
+        filled_tracks = [i + 1 for i in tracks_in_mask(current.has_clip)]
+        armed_tracks = [i + 1 for i in tracks_in_mask(current.armed)]
+        recording_tracks = [i + 1 for i in tracks_in_mask(current.recording)]
+        playing_tracks = [i + 1 for i in tracks_in_mask(current.playing)]
+        validation_log.debug("Current state - Tracks with clips: %s", filled_tracks if filled_tracks else 'none')
+        validation_log.debug("Current state - Armed tracks: %s", armed_tracks)
+        validation_log.debug("Current state - Recording tracks: %s", recording_tracks)
+        validation_log.debug("Current state - Playing tracks: %s", playing_tracks)
+
+    def start_listeners(self, client):
+        """
+        Registers AbletonOSC listeners for has_clip, arm, is_playing, is_recording
+        and the loop points on the player tracks, so Ableton pushes state changes
+        to us (and loop_point_cache can trust what it has seen).
+        Background validation then drops to a slow reconcile every reconcile_interval.
+        """
+        if self.listeners_active:
+            return
+        if self.listener_client is None:
+            query_engine.subscribe("/live/clip_slot/get/has_clip", lambda ids, value: self._on_pushed_state("has_clip", ids, value))
+            query_engine.subscribe("/live/track/get/arm", lambda ids, value: self._on_pushed_state("armed", ids, value))
+            query_engine.subscribe("/live/clip/get/is_recording", lambda ids, value: self._on_pushed_state("recording", ids, value))
+            query_engine.subscribe("/live/clip/get/is_playing", lambda ids, value: self._on_pushed_state("playing", ids, value))
+            query_engine.subscribe("/live/clip/get/loop_start", lambda ids, value: self._on_pushed_loop_point("loop_start", ids, value))
+            query_engine.subscribe("/live/clip/get/loop_end", lambda ids, value: self._on_pushed_loop_point("loop_end", ids, value))
+        self.listener_client = client
+        batch = CommandBatch()
+        for track_idx in range(self.num_tracks):
+            batch.add("/live/track/start_listen/arm", [track_idx])
+            for scene in range(self.num_scenes):
+                batch.add("/live/clip_slot/start_listen/has_clip", [track_idx, scene])
+                self._listen_to_clip(batch, track_idx, scene)
+        for scene in range(self.num_scenes):
+            loop_point_cache.watch(range(self.num_tracks), scene)
+        batch.send(client)
+        self.listeners_active = True
+        validation_log.info("Listening for Ableton state changes (reconcile every %s seconds)", self.reconcile_interval)
+
+    def stop_listeners(self, client):
+        if not self.listeners_active:
+            return
+        batch = CommandBatch()
+        for track_idx in range(self.num_tracks):
+            batch.add("/live/track/stop_listen/arm", [track_idx])
+            for scene in range(self.num_scenes):
+                batch.add("/live/clip_slot/stop_listen/has_clip", [track_idx, scene])
+                for prop in CLIP_LISTEN_PROPS:
+                    batch.add(f"/live/clip/stop_listen/{prop}", [track_idx, scene])
+        batch.send(client)
+        loop_point_cache.unwatch_all()
+        self.listeners_active = False
+        validation_log.info("Stopped listening for Ableton state changes")
+
+    def _listen_to_clip(self, batch, track_idx, scene):
+        # Clip listeners only attach to an existing clip, so they are re-sent whenever a clip appears.
+        for prop in CLIP_LISTEN_PROPS:
+            batch.add(f"/live/clip/start_listen/{prop}", [track_idx, scene])
+
+    def _on_pushed_state(self, field, ids, value):
+        track_idx = ids[0]
+        scene = ids[1] if len(ids) > 1 else None
+        if scene is not None and not 0 <= scene < self.num_scenes:
+            return
+        value = bool(int(value))
+        if not self._set_bit(field, track_idx, value, scene):
+            return
+        validation_log.debug("Pushed state: Track %s %s: %s (scene %s)", track_idx+1, field, value, scene + 1 if scene is not None else "all")
+        if field == "has_clip" and value and self.listeners_active:
+            batch = CommandBatch()
+            self._listen_to_clip(batch, track_idx, scene)
+            batch.send(self.listener_client)
+        if field != "armed":
+            self.schedule_broadcast(headsets)
+
+    def _on_pushed_loop_point(self, field, ids, value):
+        track_idx, slot = ids
+        if not (0 <= track_idx < self.num_tracks and 0 <= slot < self.num_scenes):
+            return
+        value = float(value)
+        if self.clip_loop_points.get((track_idx, slot, field)) == value:
+            return
+        self.clip_loop_points[(track_idx, slot, field)] = value
+        validation_log.debug("Pushed state: Track %s, scene %s %s: %s", track_idx+1, slot+1, field, value)
+        # The base clip changed length, or another clip drifted from it.
+        if slot == self.clip_slot_index:
+            clip_length_reconciler.request()
+
+    def presence_grid_requests(self, num_scenes=None):
+        num_scenes = num_scenes or self.layout.slots_per_track
+        return [("/live/clip_slot/get/has_clip", [track_idx, scene])
+                for scene in range(num_scenes) for track_idx in range(self.num_tracks)]
+
+    def _presence_grid_from(self, requests, values):
+        # Bit (scene * num_tracks + track), so each scene's row has the same layout as the snapshot masks.
+        grid = 0
+        answered = 0
+        for bit, value in enumerate(values):
+            if value is None:
+                continue
+            answered |= 1 << bit
+            if bool(int(value)):
+                grid |= 1 << bit
+        missed = values.count(None)
+        if missed:
+            validation_log.debug("Presence grid: %s of %s queries timed out.", missed, len(requests))
+        return grid, answered
+
+    def get_clip_presence_grid(self, client, num_scenes=None, timeout=0.5):
+        """
+        Queries has_clip for every track in every scene (clip slot) at once and
+        returns the result as two bitmaps, (grid, answered): bit scene * num_tracks
+        + track of grid is set when that slot holds a clip, and of answered when
+        its query got a reply, so a timeout can be told apart from an empty slot.
+        Every query shares one timeout, so the scan takes one round trip however
+        many scenes there are. Use scene_row() to split them.
+        """
+        requests = self.presence_grid_requests(num_scenes)
+        futures = query_engine.submit_many(client, requests)
+        return self._presence_grid_from(requests, query_engine.wait_all(requests, futures, timeout))
+
+    async def get_clip_presence_grid_async(self, client, num_scenes=None, timeout=0.5):
+        requests = self.presence_grid_requests(num_scenes)
+        futures = query_engine.submit_many(client, requests)
+        return self._presence_grid_from(requests, await query_engine.wait_all_async(requests, futures, timeout))
+
+    def scene_row(self, grid, scene):
+        """
+        Returns one scene's track mask from a presence grid.
+        """
+        return (grid >> (scene * self.num_tracks)) & ((1 << self.num_tracks) - 1)
+    
+    def schedule_broadcast(self, headsets):
+        """
+        Sends a headset update broadcast_delay from now, unless one is already
+        scheduled, so a burst of pushes (e.g. every clip of a fired scene
+        starting) reaches the headsets as one update instead of one per push.
+        Runs on the event loop under the asyncio core, else on a timer thread.
+        """
+        with self.lock:
+            if self.broadcast_pending:
+                self.coalesced_pushes += 1
+                return
+            self.broadcast_pending = True
+        try:
+            asyncio.get_running_loop().call_later(self.broadcast_delay, self._send_scheduled_broadcast, headsets)
+        except RuntimeError:
+            timer = threading.Timer(self.broadcast_delay, self._send_scheduled_broadcast, args=(headsets,))
+            timer.daemon = True
+            timer.start()
+
+    def _send_scheduled_broadcast(self, headsets):
+        # Cleared first: a push landing during the send schedules the next update.
+        with self.lock:
+            self.broadcast_pending = False
+        self.send_full_clip_state_update(headsets)
+
+    def send_full_clip_state_update(self, headsets, force=False, destinations=None):
+        """
+        Sends the clip arrays to each headset, skipping any array that headset
+        already has. Every keepalive_interval (or with force=True) a headset
+        gets every array again in case a datagram was lost. Each array is
+        encoded once and sent to every headset that needs it. destinations
+        limits the update to some headsets (e.g. one that just joined).
+
+        /VROSC/clippresence, /clipisplaying and /clipisrecording describe the
+        active scene, one entry per track. /VROSC/scene is [active scene,
+        number of scenes], and /VROSC/scenepresence and /scenesplaying hold
+        every scene, scene by scene (entry scene * num_tracks + track).
+        """
+        now = time.monotonic()
+        started = time.perf_counter()
+        # The snapshot is taken under send_lock, so a call can't record an older state as sent after a newer one.
+        with self.send_lock:
+            with self.lock:
+                snapshot, changes, scene = self.snapshot, self.changes, self.clip_slot_index
+                presence_grid, playing_grid = self.state_grid("has_clip"), self.state_grid("playing")
+            grid_size = self.num_tracks * self.num_scenes
+            # address -> (value to compare with what the headset has, function building the OSC args)
+            arrays = {
+                "/VROSC/clippresence": (snapshot.has_clip, lambda: snapshot.as_list("has_clip", self.num_tracks)),
+                "/VROSC/clipisplaying": (snapshot.playing, lambda: snapshot.as_list("playing", self.num_tracks)),
+                "/VROSC/clipisrecording": (snapshot.recording, lambda: snapshot.as_list("recording", self.num_tracks)),
+                "/VROSC/scene": (scene, lambda: [scene, self.num_scenes]),
+                "/VROSC/scenepresence": (presence_grid, lambda: [(presence_grid >> i) & 1 for i in range(grid_size)]),
+                "/VROSC/scenesplaying": (playing_grid, lambda: [(playing_grid >> i) & 1 for i in range(grid_size)]),
+            }
+            needed_by = {}  # address -> headsets that need it
+            for destination in (headsets.targets() if destinations is None else destinations):
+                last = self.last_sent.get(destination)  # (changes, {address: value}, last full resync time)
+                full = force or last is None or now - last[2] >= self.keepalive_interval
+                if not full and last[0] == changes:
+                    self.suppressed_sends += len(arrays)
+                    continue
+                for address, (value, _) in arrays.items():
+                    if full or last[1].get(address) != value:
+                        needed_by.setdefault(address, []).append(destination)
+                    else:
+                        self.suppressed_sends += 1
+                self.last_sent[destination] = (changes, {address: value for address, (value, _) in arrays.items()},
+                                               now if full else last[2])
+            for address, (_, build_args) in arrays.items():
+                if address in needed_by:
+                    headsets.send_message(address, build_args(), needed_by[address])
+        if needed_by:
+            metrics.record("headset.broadcast", time.perf_counter() - started)
+            if headset_log.isEnabledFor(logging.DEBUG):
+                headset_log.debug("Sent OSC to headsets: %s (scene=%s, presence=%s, playing=%s, recording=%s)",
+                                  ", ".join(f"{address} x{len(dests)}" for address, dests in needed_by.items()), scene + 1,
+                                  snapshot.as_list("has_clip", self.num_tracks), snapshot.as_list("playing", self.num_tracks),
+                                  snapshot.as_list("recording", self.num_tracks))
+
+    def get_next_track(self, current_track, player):
+        """
+        Returns the next track index in the series based on the player.
+        Wraps around to the first track if the end is reached.
+        """
+        return self.layout.next_track(current_track)
+
+    def mark_track_is_recording(self, track_index, is_recording):
+        if 0 <= track_index < self.num_tracks:
+            self._set_bit("recording", track_index, is_recording)
+            validation_log.debug("Internal state updated: Track %s is recording: %s", track_index+1, is_recording)
+
+    def get_track_is_recording(self, track_index):
+        return self.snapshot.is_set("recording", track_index)
+
+    def mark_track_is_playing(self, track_index, is_playing):
+        if 0 <= track_index < self.num_tracks:
+            self._set_bit("playing", track_index, is_playing)
+            validation_log.debug("Internal state updated: Track %s is playing: %s", track_index+1, is_playing)
+
+    def get_track_is_playing(self, track_index):
+        return self.snapshot.is_set("playing", track_index)
+
+    def reset(self, scene=None):
+        """
+        Clears every scene, or only scene's clips (arm state is kept, since it
+        belongs to the tracks).
+        """
+        with self.lock:
+            for target in (range(self.num_scenes) if scene is None else [scene]):
+                armed = 0 if scene is None else self.scene_snapshots[target].armed
+                self._publish(target, TrackSnapshot(0, armed, 0, 0, 0))
+        validation_log.debug("StateTracker: %s track states reset.", "All" if scene is None else f"Scene {scene + 1}")
+
+    def restore(self, scenes, active_scene):
+        """
+        Publishes a TrackSnapshot per scene from a saved session and makes
+        active_scene the active one.
+        """
+        with self.lock:
+            self.clip_slot_index = active_scene
+            for scene, snapshot in enumerate(scenes):
+                self._publish(scene, snapshot)
+        clip_length_reconciler.request()
+
+# --- OSC Query Engine ---
+class OSCQueryEngine:
+    """
+    Long-lived request/response layer on top of the port 11001 dispatcher.
+    Each reply address gets one permanent handler, and replies are matched to
+    pending futures by (address, track, slot), so any number of queries can be
+    in flight at once without handlers clobbering each other.
+    """
+    def __init__(self, osc_dispatcher):
+        self.dispatcher = osc_dispatcher
+        self.key_sizes = {}  # query address -> number of leading id args (track, slot)
+        self.pending = {}    # (address, *ids) -> list of (future, monotonic send time)
+        self.listeners = {}  # address -> callbacks for every reply, including listener pushes
+        self.lock = threading.Lock()
+
+    def register(self, address, key_size, reply_addresses=None):
+        """
+        Maps one permanent handler for every address Ableton may answer a query on.
+        Replies on any of reply_addresses resolve queries sent to address.
+        """
+        self.key_sizes[address] = key_size
+        for reply_address in (reply_addresses or [address]):
+            self.dispatcher.map(reply_address, self._handle_reply, address)
+
+    def _handle_reply(self, unused_addr, fixed_args, *args):
+        address = fixed_args[0]
+        key_size = self.key_sizes[address]
+        if len(args) <= key_size:
+            return
+        try:
+            key = (address,) + tuple(int(a) for a in args[:key_size])
+        except (TypeError, ValueError):
+            return
+        received_at = time.monotonic()
+        with self.lock:
+            waiting = self.pending.pop(key, [])
+            callbacks = list(self.listeners.get(address, []))
+        for _, sent_at in waiting:
+            metrics.record(f"query.rtt {address}", received_at - sent_at)
+        for future, _ in waiting:
+            if not future.done():
+                future.set_result(args[key_size])
+        for callback in callbacks:
+            try:
+                callback(key[1:], args[key_size])
+            except Exception as e:
+                query_log.error("Error in OSC listener for %s: %s", address, e)
+
+    def subscribe(self, address, callback):
+        """
+        Calls callback(ids, value) for every reply on address. AbletonOSC pushes
+        start_listen updates on the same address as query replies.
+        """
+        with self.lock:
+            self.listeners.setdefault(address, []).append(callback)
+
+    def submit(self, client, address, key_args):
+        """
+        Sends a query and returns a Future that resolves with the reply value.
+        Does not block, so callers can fire many queries before waiting on any.
+        """
+        key = (address,) + tuple(int(a) for a in key_args)
+        future = Future()
+        with self.lock:
+            self.pending.setdefault(key, []).append((future, time.monotonic()))
+        client.send_message(address, list(key_args))
+        return future
+
+    def wait(self, address, key_args, future, timeout):
+        """
+        Waits for a submitted query. Returns the reply value or None on timeout.
+        """
+        try:
+            return future.result(timeout=max(timeout, 0.0))
+        except FutureTimeoutError:
+            self.cancel(address, key_args, future)
+            return None
+
+    def cancel(self, address, key_args, future):
+        key = (address,) + tuple(int(a) for a in key_args)
+        with self.lock:
+            waiting = self.pending.get(key)
+            if waiting:
+                waiting[:] = [entry for entry in waiting if entry[0] is not future]
+                if not waiting:
+                    del self.pending[key]
+        future.cancel()
+
+    def query(self, client, address, key_args, timeout=0.5):
+        future = self.submit(client, address, key_args)
+        return self.wait(address, key_args, future, timeout)
+
+    async def wait_async(self, address, key_args, future, timeout):
+        """
+        Awaitable version of wait() for the asyncio core.
+        """
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), max(timeout, 0.0))
+        except asyncio.TimeoutError:
+            self.cancel(address, key_args, future)
+            return None
+
+    def submit_many(self, client, requests):
+        """
+        Sends every (address, key_args) request up front and returns their futures.
+        """
+        return [self.submit(client, address, key_args) for address, key_args in requests]
+
+    def wait_all(self, requests, futures, timeout):
+        """
+        Collects the replies for submit_many against a single deadline.
+        Returns the values in request order, with None for anything that timed out.
+        """
+        deadline = time.monotonic() + timeout
+        return [
+            self.wait(address, key_args, future, deadline - time.monotonic())
+            for (address, key_args), future in zip(requests, futures)
+        ]
+
+    async def wait_all_async(self, requests, futures, timeout):
+        deadline = time.monotonic() + timeout
+        return [
+            await self.wait_async(address, key_args, future, deadline - time.monotonic())
+            for (address, key_args), future in zip(requests, futures)
+        ]
+
+query_engine = OSCQueryEngine(global_dispatcher)
+query_engine.register("/live/clip_slot/get/has_clip", 2, [
+    "/live/clip_slot/get/has_clip",
+    "/live/clip_slot/get/has_clip/return",
+    "/live/clip/get/exists/return",
+])
+query_engine.register("/live/track/get/arm", 1)
+query_engine.register("/live/clip/get/is_recording", 2)
+query_engine.register("/live/clip/get/is_playing", 2)
+query_engine.register("/live/clip/get/loop_start", 2)
+query_engine.register("/live/clip/get/loop_end", 2)
+query_engine.register("/live/song/get/tempo", 0)
+query_engine.register("/live/song/get/beat", 0)
+
+# --- Loop Point Cache ---
+LOOP_POINT_FIELDS = ("loop_start", "loop_end")
+
+class LoopPointCache:
+    """
+    Last known loop_start/loop_end per (track, slot), filled from every reply
+    and listener push on the loop point addresses. Only slots Ableton is
+    listening on for us (see StateTracker.start_listeners) are cached, since
+    only those are guaranteed to push a change. Entries are dropped when we
+    write different loop points, when a take starts or stops recording and
+    when the clip is deleted, so the next read goes back to Ableton.
+    """
+    def __init__(self):
+        self.entries = {}    # (track, slot) -> {"loop_start": value, "loop_end": value}
+        self.watched = set()
+        self.recording = {}  # (track, slot) -> last is_recording value seen
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def watch(self, tracks, slot):
+        with self.lock:
+            self.watched.update((track, slot) for track in tracks)
+
+    def unwatch_all(self):
+        with self.lock:
+            self.watched.clear()
+            self.entries.clear()
+            self.recording.clear()
+
+    def get(self, track, slot):
+        """
+        Returns {field: value} for the fields that are cached (possibly empty),
+        counting a hit only when both loop points are known.
+        """
+        with self.lock:
+            entry = dict(self.entries.get((track, slot), {}))
+            if len(entry) == len(LOOP_POINT_FIELDS):
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry
+
+    def _fill(self, field, ids, value):
+        key = tuple(ids)
+        with self.lock:
+            if key in self.watched:
+                self.entries.setdefault(key, {})[field] = float(value)
+
+    def _on_recording(self, ids, value):
+        # A take starting or finishing changes the clip's length under us.
+        key = tuple(ids)
+        recording = bool(int(value))
+        with self.lock:
+            if self.recording.get(key) != recording:
+                self.recording[key] = recording
+                self.entries.pop(key, None)
+
+    def _on_has_clip(self, ids, value):
+        if not bool(int(value)):
+            self.invalidate(*ids)
+
+    def peek(self, track, slot):
+        """
+        Like get(), without counting towards the hit rate.
+        """
+        with self.lock:
+            return dict(self.entries.get((track, slot), {}))
+
+    def written(self, track, slot, loop_start, loop_end):
+        """
+        Called for our own set/loop_* writes. The entry is dropped unless it
+        already holds exactly these points, in which case Live has nothing to
+        change (and will push nothing) so the entry stays valid.
+        """
+        with self.lock:
+            if self.entries.get((track, slot)) != {"loop_start": loop_start, "loop_end": loop_end}:
+                self.entries.pop((track, slot), None)
+
+    def invalidate(self, track, slot):
+        with self.lock:
+            self.entries.pop((track, slot), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return f"{len(self.entries)}/{len(self.watched)} slots, {self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate)"
+
+loop_point_cache = LoopPointCache()
+# Subscribed before the StateTracker's own listeners, so an entry is already dropped by the
+# time a waiter woken by the same is_recording or has_clip push reads the loop points.
+for field in LOOP_POINT_FIELDS:
+    query_engine.subscribe(f"/live/clip/get/{field}", lambda ids, value, field=field: loop_point_cache._fill(field, ids, value))
+query_engine.subscribe("/live/clip/get/is_recording", loop_point_cache._on_recording)
+query_engine.subscribe("/live/clip_slot/get/has_clip", loop_point_cache._on_has_clip)
+
+# --- OSC Query Helpers ---
+def loop_points_from(cached, values):
+    loop_points = []
+    for field in LOOP_POINT_FIELDS:
+        value = cached[field] if field in cached else values.pop(0)
+        loop_points.append(float(value) if value is not None else None)
+    return loop_points
+
+def query_clip_loop_points(client, track_index, clip_slot_index, timeout=6.0):
+    """
+    Queries Ableton for the loop start and end positions of a clip.
+    Returns [loop_start, loop_end] (in beats) or [None, None] if not available.
+    Points already in loop_point_cache are not queried again; the rest are in
+    flight together and share one timeout.
+    """
+    cached = loop_point_cache.get(track_index, clip_slot_index)
+    key_args = [track_index, clip_slot_index]
+    requests = [(f"/live/clip/get/{field}", key_args) for field in LOOP_POINT_FIELDS if field not in cached]
+    values = []
+    if requests:
+        futures = query_engine.submit_many(client, requests)
+        values = query_engine.wait_all(requests, futures, timeout)
+    result = loop_points_from(cached, values)
+
+    query_log.debug("Final query result for track %s, slot %s: %s (%s cached)", track_index+1, clip_slot_index+1, result, len(cached))
+    return result
+
+# --- Acknowledged Loop Point Writes ---
+def send_loop_points(client, tracks, clip_slot_index, loop_start, loop_end):
+    batch = CommandBatch()
+    for track_idx in tracks:
+        loop_point_cache.written(track_idx, clip_slot_index, loop_start, loop_end)
+        batch.add("/live/clip/set/loop_start", [track_idx, clip_slot_index, loop_start])
+        batch.add("/live/clip/set/loop_end", [track_idx, clip_slot_index, loop_end])
+    batch.send(client)
+
+def loop_point_requests(tracks, clip_slot_index):
+    requests = []
+    for track_idx in tracks:
+        requests.append(("/live/clip/get/loop_start", [track_idx, clip_slot_index]))
+        requests.append(("/live/clip/get/loop_end", [track_idx, clip_slot_index]))
+    return requests
+
+def mismatched_tracks(tracks, values, loop_start, loop_end, tolerance=1e-6):
+    """
+    Given read-back values from loop_point_requests, returns the tracks whose
+    loop points are missing or differ from what was written.
+    """
+    mismatched = []
+    for i, track_idx in enumerate(tracks):
+        start, end = values[2 * i], values[2 * i + 1]
+        if start is None or end is None or abs(float(start) - loop_start) > tolerance or abs(float(end) - loop_end) > tolerance:
+            mismatched.append(track_idx)
+    return mismatched
+
+def write_loop_points_acked(client, tracks, clip_slot_index, loop_start, loop_end, retries=3, timeout=0.5):
+    """
+    Sends set/loop_start and set/loop_end for every track in one burst, then
+    confirms them with a single batched read-back, re-sending only the tracks
+    that don't match. AbletonOSC handles messages in order, so each read-back
+    sees the write sent just before it.
+    Returns the tracks that still disagree after all retries.
+    """
+    pending = list(tracks)
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        send_loop_points(client, pending, clip_slot_index, loop_start, loop_end)
+        requests = loop_point_requests(pending, clip_slot_index)
+        futures = query_engine.submit_many(client, requests)
+        values = query_engine.wait_all(requests, futures, timeout)
+        pending = mismatched_tracks(pending, values, loop_start, loop_end)
+        if pending:
+            sync_log.debug("Loop points not confirmed on tracks %s (attempt %s).", [t + 1 for t in pending], attempt+1)
+    return pending
+
+# --- Initializing Base Clip Length ---
+def initialize_base_clip_length(client, state_tracker):
+    """
+    Attempts to get the loop length from track 0, clip 0 and set it as the base clip length.
+    """
+    global base_clip_length
+    
+    if not state_tracker.get_track_has_clip(0):
+        sync_log.error("Cannot initialize base clip length - track 1 has no clip in scene %s.", state_tracker.clip_slot_index+1)
+        return False
+    
+    sync_log.debug("Initializing base clip length from track 1, scene %s...", state_tracker.clip_slot_index+1)
+    
+    # Try multiple times if needed
+    for attempt in range(3):
+        # Give Ableton time to finish processing
+        time.sleep(0.5)
+        
+        loop_points = query_clip_loop_points(client, 0, state_tracker.clip_slot_index, timeout=2.0)
+        if loop_points[0] is not None and loop_points[1] is not None:
+            base_clip_length = loop_points[1] - loop_points[0]
+            sync_log.info("Base clip length set to %s beats (attempt %s).", base_clip_length, attempt+1)
+            return True
+        else:
+            sync_log.warning("Failed to get loop points on attempt %s, retrying...", attempt+1)
+    
+    sync_log.error("Failed to initialize base clip length after multiple attempts.")
+    return False
+
+# --- Transport Clock ---
+TRANSPORT_CONFIG = {
+    "quantize": True,      # Schedule record start/stop on bar / base clip length boundaries
+    "beats_per_bar": 4,
+    # Scheduled sends aim to arrive this many seconds before the boundary. With Live's global
+    # launch quantization at 1 bar, an early arrival still starts/stops exactly on the bar.
+    "lead_time": 0.010,
+}
+
+class TransportClock:
+    """
+    Follows Ableton's song position from the beat listener and schedules
+    record start/stop sends to arrive on a boundary: takes start on the next
+    bar, and stop after a whole number of base_clip_length beats, so they
+    come out at the base length without a loop point correction pass.
+    Beat pushes and send times are corrected by the one-way latency (half
+    the tempo query round trip measured while connecting).
+    Scheduled sends run on a Timer thread, or on the event loop under the
+    asyncio core, and reset_takes() cancels any that have not gone out yet.
+    """
+    def __init__(self, beats_per_bar=4, lead_time=0.010):
+        self.beats_per_bar = beats_per_bar
+        self.lead_time = lead_time
+        self.tempo = None
+        self.anchor = None  # (beat, monotonic time Ableton was on that beat)
+        self.one_way_latency = 0.0
+        self.record_start_beat = {}  # track -> beat its take starts on
+        self.stop_send_at = {}       # track -> monotonic time its scheduled stop goes out
+        self.on_grid = set()         # tracks whose take was stopped exactly one base length after it started
+        self.pending = {}            # (track, "start"/"stop") -> (token, Timer or loop handle) of a scheduled send
+        self.loop = None             # Event loop scheduled sends run on under the asyncio core
+        self.lock = threading.Lock()
+        self.active = False
+
+    def start(self, client, loop=None):
+        """
+        Starts following the song position. Uses the latency already measured
+        by the connection check; the beat and tempo listeners do the rest.
+        """
+        self.loop = loop
+        rtt = metrics.summary().get("query.rtt /live/song/get/tempo")
+        self.one_way_latency = rtt[1] / 2000 if rtt else 0.0
+        if not self.active:
+            query_engine.subscribe("/live/song/get/beat", self._on_beat)
+            query_engine.subscribe("/live/song/get/tempo", self._on_tempo)
+        batch = CommandBatch()
+        batch.add("/live/song/start_listen/beat", [])
+        batch.add("/live/song/start_listen/tempo", [])
+        batch.add("/live/song/get/tempo", [])
+        batch.send(client)
+        self.active = True
+        sync_log.info("Transport clock started (one-way latency %.1f ms)", self.one_way_latency * 1000)
+
+    def stop(self, client):
+        if not self.active:
+            return
+        batch = CommandBatch()
+        batch.add("/live/song/stop_listen/beat", [])
+        batch.add("/live/song/stop_listen/tempo", [])
+        batch.send(client)
+        self.active = False
+
+    def _on_beat(self, ids, value):
+        with self.lock:
+            self.anchor = (float(value), time.monotonic() - self.one_way_latency)
+
+    def _on_tempo(self, ids, value):
+        with self.lock:
+            if self.anchor is not None and self.tempo:
+                # Re-anchor at the current position so the new tempo only applies from now on.
+                now = time.monotonic()
+                self.anchor = (self._beat_at(now), now)
+            self.tempo = float(value)
+
+    def _beat_at(self, t):
+        beat, anchor_time = self.anchor
+        return beat + (t - anchor_time) * self.tempo / 60.0
+
+    def _time_of(self, beat):
+        anchor_beat, anchor_time = self.anchor
+        return anchor_time + (beat - anchor_beat) * 60.0 / self.tempo
+
+    def synced(self):
+        """
+        True while Ableton's transport is running and pushing beats.
+        """
+        with self.lock:
+            if not self.active or self.anchor is None or not self.tempo:
+                return False
+            return time.monotonic() - self.anchor[1] < 2 * 60.0 / self.tempo
+
+    def next_boundary(self, quantum, origin=0.0, min_steps=0):
+        """
+        Returns (beat, monotonic time) of the first origin + k * quantum
+        boundary (k >= min_steps) that a send made now can still reach.
+        """
+        with self.lock:
+            earliest = self._beat_at(time.monotonic() + self.one_way_latency + self.lead_time)
+            k = max(min_steps, math.ceil((earliest - origin) / quantum - 1e-9))
+            beat = origin + k * quantum
+            return beat, self._time_of(beat)
+
+    def _schedule(self, client, batch, boundary_time, key):
+        send_at = boundary_time - self.one_way_latency - self.lead_time
+        delay = send_at - time.monotonic()
+        if delay <= 0:
+            batch.send(client)
+            return send_at
+        token = object()
+        if self.loop is not None:
+            handle = self.loop.call_at(self.loop.time() + delay, self._fire, key, token, client, batch, send_at)
+        else:
+            handle = threading.Timer(delay, self._fire, args=(key, token, client, batch, send_at))
+            handle.daemon = True
+        with self.lock:
+            replaced = self.pending.get(key)
+            self.pending[key] = (token, handle)
+        if replaced:
+            replaced[1].cancel()
+        if self.loop is None:
+            handle.start()
+        return send_at
+
+    def _fire(self, key, token, client, batch, send_at):
+        # Sent under the lock, so a reset_takes() either cancels this send or runs after it.
+        with self.lock:
+            if self.pending.get(key, (None,))[0] is not token:
+                return
+            del self.pending[key]
+            batch.send(client)
+        metrics.record("transport.send_error", time.monotonic() - send_at)
+
+    def schedule_record_start(self, client, batch, track):
+        beat, boundary_time = self.next_boundary(self.beats_per_bar)
+        self.record_start_beat[track] = beat
+        self.on_grid.discard(track)
+        self._schedule(client, batch, boundary_time, (track, "start"))
+        sync_log.debug("Track %s: record start scheduled for beat %s", track + 1, beat)
+
+    def schedule_record_stop(self, client, batch, track):
+        origin = self.record_start_beat.pop(track, None)
+        if base_clip_length and origin is not None:
+            # At least one base length after the take started, even if the start is still pending.
+            beat, boundary_time = self.next_boundary(base_clip_length, origin, min_steps=1)
+            if beat - origin == base_clip_length:
+                self.on_grid.add(track)
+        else:
+            # No base length yet: this take defines it, so any whole bar is on the grid.
+            beat, boundary_time = self.next_boundary(self.beats_per_bar)
+            if base_clip_length is None:
+                self.on_grid.add(track)
+        self.stop_send_at[track] = self._schedule(client, batch, boundary_time, (track, "stop"))
+        sync_log.debug("Track %s: record stop scheduled for beat %s", track + 1, beat)
+
+    def seconds_until_stop(self, track):
+        send_at = self.stop_send_at.pop(track, None)
+        return max(0.0, send_at - time.monotonic()) if send_at is not None else 0.0
+
+    def all_on_grid(self, tracks):
+        return all(track in self.on_grid for track in tracks)
+
+    def reset_takes(self):
+        """
+        Forgets every take and cancels record sends that have not gone out,
+        so nothing starts or stops in a scene that was deleted or left.
+        """
+        with self.lock:
+            cancelled = list(self.pending.values())
+            self.pending.clear()
+        for token, handle in cancelled:
+            handle.cancel()
+        if cancelled:
+            sync_log.info("Cancelled %s scheduled record send(s).", len(cancelled))
+        self.record_start_beat.clear()
+        self.stop_send_at.clear()
+        self.on_grid.clear()
+
+transport_clock = TransportClock(TRANSPORT_CONFIG["beats_per_bar"], TRANSPORT_CONFIG["lead_time"])
+
+def send_record_command(client, batch, track, starting):
+    """
+    Sends a record start/stop batch, on the next boundary when the transport
+    clock is following Ableton, otherwise immediately.
+    """
+    if TRANSPORT_CONFIG["quantize"] and transport_clock.synced():
+        if starting:
+            transport_clock.schedule_record_start(client, batch, track)
+        else:
+            transport_clock.schedule_record_stop(client, batch, track)
+    else:
+        batch.send(client)
+
+def correction_needed(track_index, loop_points, state_tracker):
+    """
+    False when every filled track's take was stopped exactly one base length
+    after it started and this one really came out at the base length.
+    """
+    on_grid = transport_clock.all_on_grid(state_tracker.get_all_filled_tracks())
+    return not (on_grid and loop_points[1] - loop_points[0] == base_clip_length)
+
+# --- Finalizing Recording ---
+def finalize_recording(client, track_index, clip_slot_index, state_tracker):
+    sync_log.debug("Finalizing recording on track %s, slot %s...", track_index+1, clip_slot_index+1)
+
+    # A quantized stop only goes out on the boundary, so wait for that first.
+    stop_delay = transport_clock.seconds_until_stop(track_index)
+    if stop_delay:
+        time.sleep(stop_delay)
+    # With listeners active, Ableton tells us when the take actually stops; otherwise give it a second.
+    if state_tracker.listeners_active and state_tracker.get_track_is_recording(track_index):
+        state_tracker.wait_for(lambda snapshot: not snapshot.is_set("recording", track_index), timeout=4.0)
+    else:
+        time.sleep(1.0)
+
+    max_attempts = 20
+    loop_points = [None, None]
+    for attempt in range(max_attempts):
+        # Each attempt returns as soon as both replies land; a miss has already waited out its timeout.
+        loop_points = query_clip_loop_points(client, track_index, clip_slot_index, timeout=1.0)
+        if loop_points[0] is not None and loop_points[1] is not None:
+            break
+
+    if apply_finalized_take(track_index, clip_slot_index, loop_points, state_tracker):
+        if not correction_needed(track_index, loop_points, state_tracker):
+            sync_log.info("All takes landed on the base length grid; no loop point correction needed.")
+            return
+        update_timer = threading.Timer(2.0, update_all_clips_loop_points, args=(client, state_tracker))
+        update_timer.daemon = True
+        update_timer.start()
+
+def apply_finalized_take(track_index, clip_slot_index, loop_points, state_tracker):
+    """
+    Records the result of a finished take. Returns True when a player's tracks
+    are all filled and the clips should be synchronized.
+    """
+    global base_clip_length, all_clips_recorded
+    sync_log.debug("Final loop points for track %s, slot %s: %s", track_index+1, clip_slot_index+1, loop_points)
+
+    if loop_points[0] is None or loop_points[1] is None:
+        sync_log.warning("Unable to capture loop point values after finalization.")
+        return False
+
+    clip_length = loop_points[1] - loop_points[0]
+
+    # Mark finalized track as having a clip
+    state_tracker.mark_track_has_clip(track_index, True)
+
+    if base_clip_length is None and track_index == 0 and clip_slot_index == state_tracker.clip_slot_index:
+        base_clip_length = clip_length
+        sync_log.info("Base clip length updated to %s beats (from first clip).", base_clip_length)
+    session_file.request()
+
+    if state_tracker.any_player_tracks_filled():
+        sync_log.info("All designated tracks now have clips. Starting synchronization after delay...")
+        all_clips_recorded = True
+        return True
+    return False
+
+
+# --- Update All Clips Loop Points ---
+def update_all_clips_loop_points(client, state_tracker):
+    """
+    Updates all recorded clips to have the same loop_end value based on the global base_clip_length.
+    This is called automatically after all clips have been recorded or manually via keyboard shortcut.
+    """
+    global base_clip_length
+    
+    # If base_clip_length is not set, try to get it from track 0
+    if base_clip_length is None:
+        if not initialize_base_clip_length(client, state_tracker):
+            sync_log.error("Cannot update clips - failed to establish base length.")
+            return
+    
+    filled_tracks = state_tracker.get_all_filled_tracks()
+    sync_log.info("Updating loop points for all clips to match length: %s beats", base_clip_length)
+
+    # One burst of writes and one batched read-back, instead of paced sends and a thread per track
+    unconfirmed = write_loop_points_acked(client, filled_tracks, state_tracker.clip_slot_index, 0.0, base_clip_length)
+    if unconfirmed:
+        sync_log.error("Loop points could not be confirmed on tracks %s.", [t + 1 for t in unconfirmed])
+    else:
+        sync_log.info("All clips updated to match base length.")
+
+# --- Recording Function ---
+def record_clip(client, state_tracker, player):
+    track_to_use = state_tracker.get_next_empty_track(player)
+    if track_to_use is None:
+        pedal_log.info("Player %s: All designated tracks (%s) are full! Clear some clips before recording more.", player, layout.describe(player))
+        return
+
+    pedal_log.info("Player %s: Recording new clip in track %s, slot %s", player, track_to_use + 1, state_tracker.clip_slot_index + 1)
+    
+    # Disarm only this player's tracks, arm the selected one and fire it as one bundle
+    batch = CommandBatch()
+    for i in layout.player_tracks[player]:
+        batch.add("/live/track/set/arm", [i, 0])
+    batch.add("/live/track/set/arm", [track_to_use, 1])
+    batch.add("/live/clip_slot/fire", [track_to_use, state_tracker.clip_slot_index])
+    batch.send(client)
+    loop_point_cache.invalidate(track_to_use, state_tracker.clip_slot_index)
+    state_tracker.mark_track_has_clip(track_to_use, True)
+    
+    # Update the active track for this player
+    player_states[player].current_active_track = track_to_use
+    pedal_log.info("Player %s: Recording started on track %s, slot %s", player, track_to_use + 1, state_tracker.clip_slot_index + 1)
+
+def handle_record_press(client, headsets, state_tracker, player, e=None):
+    """
+    One step of a player's record/finalize state machine. The first press starts
+    recording on the player's active track; the next press stops it, finalizes
+    the take and moves on to the player's next track. Called from that player's
+    PedalWorker, so presses for one player never run concurrently.
+    Returns the track whose take was just stopped, or None.
+    """
+    player_state = player_states[player]
+    pedal_log.debug("--- Player %s Record Key Pressed ---", player)
+    pedal_log.debug("PRE: waiting_for_refire=%s, current_active_track=%s", player_state.waiting_for_refire, player_state.current_active_track)
+
+    try:
+        if player_state.waiting_for_refire:
+            finalized_track = player_state.current_active_track
+            pedal_log.info("Player %s: Stopping track %s", player, finalized_track + 1)
+            # Stop the take and disarm all of this player's tracks in one bundle
+            batch = CommandBatch()
+            batch.add("/live/clip_slot/fire", [finalized_track, state_tracker.clip_slot_index])
+            for i in layout.player_tracks[player]:
+                batch.add("/live/track/set/arm", [i, 0])
+            send_record_command(client, batch, finalized_track, starting=False)
+            # Send to VR headsets via PC Transmitter port (9001)
+            headsets.send_message("/clipisrecording", [player, layout.position_of(finalized_track), False])
+
+            next_track = state_tracker.get_next_track(finalized_track, player)
+
+            with player_state.lock:
+                player_state.current_active_track = next_track
+                player_state.waiting_for_refire = False
+                pedal_log.debug("Player %s: Set waiting_for_refire = False", player)
+            return finalized_track
+        else:
+            if player_state.current_active_track is None:
+                player_state.current_active_track = state_tracker.get_next_empty_track(player)
+                client.send_message("/live/track/set/arm", [layout.input_track(player), 1])
+                if player_state.current_active_track is None:
+                    pedal_log.info("Player %s: No available tracks.", player)
+                    return None
+
+            active_track = player_state.current_active_track
+            pedal_log.info("Player %s: Starting recording on track %s", player, active_track + 1)
+
+            # Set before the fire goes out, so nothing racing the take's first pushes sees the player idle.
+            with player_state.lock:
+                player_state.waiting_for_refire = True
+                pedal_log.debug("Player %s: Set waiting_for_refire = True", player)
+
+            batch = CommandBatch()
+            for i in layout.player_tracks[player]:
+                batch.add("/live/track/set/arm", [i, 0])
+            batch.add("/live/track/set/arm", [active_track, 1])
+            batch.add("/live/clip_slot/fire", [active_track, state_tracker.clip_slot_index])
+            send_record_command(client, batch, active_track, starting=True)
+            loop_point_cache.invalidate(active_track, state_tracker.clip_slot_index)
+            # Send to VR headsets via PC Transmitter port (9001)
+            headsets.send_message("/clipisrecording", [player, layout.position_of(active_track), True])
+    except Exception as e:
+        pedal_log.error("Error in Player %s: %s", player, e)
+        with player_state.lock:
+            player_state.waiting_for_refire = False
+    finally:
+        pedal_log.debug("POST: waiting_for_refire=%s, current_active_track=%s", player_state.waiting_for_refire, player_state.current_active_track)
+    return None
+
+# --- Pedal Event Queue ---
+PedalEvent = namedtuple("PedalEvent", ["player", "action", "pressed_at"])
+
+class PedalWorker:
+    """
+    Owns one player's pedals. The input backend only timestamps the press and
+    queues it; this worker's thread runs the record/finalize state machine and
+    the stop/fire commands in press order, so presses are queued instead of
+    dropped while one is being handled.
+    """
+    def __init__(self, player, client, headsets, state_tracker, max_pending=8, coalesce_window=0.08):
+        self.player = player
+        self.client = client
+        self.headsets = headsets
+        self.state_tracker = state_tracker
+        self.queue = queue.Queue(maxsize=max_pending)
+        # Presses closer together than this are treated as pedal bounce and coalesced into one.
+        self.coalesce_window = coalesce_window
+        self.last_pressed_at = {}  # action -> time of the last press that was handled
+        self.dropped = 0    # Presses rejected because the queue was full
+        self.coalesced = 0  # Presses merged into the previous one
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f"pedal-player{self.player}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self.thread:
+            self.thread.join(timeout=1.0)
+
+    def submit(self, action="record", pressed_at=None):
+        """
+        Called from the input hook thread. Stamps the press and queues it without blocking.
+        """
+        event = PedalEvent(self.player, action, pressed_at if pressed_at is not None else time.perf_counter())
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            pedal_log.warning("Player %s: pedal queue full, dropping press (%s dropped so far).", self.player, self.dropped)
+            return False
+
+    def _should_coalesce(self, event):
+        last = self.last_pressed_at.get(event.action)
+        if last is not None and event.pressed_at - last < self.coalesce_window:
+            self.coalesced += 1
+            pedal_log.info("Player %s: coalesced %s press %.0f ms after the previous one.", self.player, event.action, (event.pressed_at - last) * 1000)
+            return True
+        self.last_pressed_at[event.action] = event.pressed_at
+        return False
+
+    def _run(self):
+        while self.running:
+            event = self.queue.get()
+            if event is None:
+                break
+            if self._should_coalesce(event):
+                continue
+            try:
+                if event.action == "record":
+                    finalized_track = handle_record_press(self.client, self.headsets, self.state_tracker, self.player)
+                    if finalized_track is not None:
+                        threading.Thread(
+                            target=finalize_recording,
+                            args=(self.client, finalized_track, self.state_tracker.clip_slot_index, self.state_tracker),
+                            daemon=True
+                        ).start()
+                elif event.action == "stop":
+                    stop_clips(self.client, self.headsets)
+                elif event.action == "fire":
+                    fire_scene(self.client, self.headsets, self.state_tracker)
+            except Exception as e:
+                pedal_log.error("Error in Player %s pedal worker: %s", self.player, e)
+            metrics.record("pedal.press_to_send", time.perf_counter() - event.pressed_at)
+
+class AsyncPedalWorker(PedalWorker):
+    """
+    PedalWorker for the asyncio core: the input thread hands presses to the
+    event loop, and finalizing a take is a task instead of a thread.
+    """
+    def __init__(self, player, client, headsets, state_tracker, loop, max_pending=8, coalesce_window=0.08):
+        super().__init__(player, client, headsets, state_tracker, max_pending, coalesce_window)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.task = None
+
+    def start(self):
+        self.running = True
+        self.task = self.loop.create_task(self._run())
+
+    def stop(self):
+        self.running = False
+        if self.task:
+            self.task.cancel()
+
+    def submit(self, action="record", pressed_at=None):
+        event = PedalEvent(self.player, action, pressed_at if pressed_at is not None else time.perf_counter())
+        self.loop.call_soon_threadsafe(self._enqueue, event)
+        return True
+
+    def _enqueue(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            pedal_log.warning("Player %s: pedal queue full, dropping press (%s dropped so far).", self.player, self.dropped)
+
+    async def _run(self):
+        while self.running:
+            event = await self.queue.get()
+            if self._should_coalesce(event):
+                continue
+            try:
+                if event.action == "record":
+                    finalized_track = handle_record_press(self.client, self.headsets, self.state_tracker, self.player)
+                    if finalized_track is not None:
+                        self.loop.create_task(async_finalize_recording(
+                            self.client, finalized_track, self.state_tracker.clip_slot_index, self.state_tracker))
+                elif event.action == "stop":
+                    stop_clips(self.client, self.headsets)
+                elif event.action == "fire":
+                    fire_scene(self.client, self.headsets, self.state_tracker)
+            except Exception as e:
+                pedal_log.error("Error in Player %s pedal worker: %s", self.player, e)
+            metrics.record("pedal.press_to_send", time.perf_counter() - event.pressed_at)
+
+class GlobalActionWorker:
+    """
+    Runs the controller-wide actions (sync, metrics, scene changes, exit) on
+    their own thread, in press order. A slow one such as sync then never
+    holds up the input backend's thread, which delivers every player's presses.
+    """
+    def __init__(self, actions, max_pending=8):
+        self.actions = actions  # action -> callable
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="pedal-global", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+
+    def submit(self, action, pressed_at=None):
+        try:
+            self.queue.put_nowait(action)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            pedal_log.warning("Controller action queue full, dropping %s (%s dropped so far).", action, self.dropped)
+            return False
+
+    def _run(self):
+        while True:
+            action = self.queue.get()
+            if action is None:
+                break
+            handler = self.actions.get(action)
+            if handler is None:
+                pedal_log.warning("Unknown controller action %s ignored.", action)
+                continue
+            try:
+                handler()
+            except Exception as e:
+                pedal_log.error("Error running controller action %s: %s", action, e)
+
+def start_pedal_input(global_actions, backend_name=None):
+    """
+    Starts the configured input backend. Player presses go to that player's
+    pedal worker; controller-wide actions go to a GlobalActionWorker that
+    calls global_actions[action]().
+    """
+    pedal_workers[None] = GlobalActionWorker(global_actions)
+    pedal_workers[None].start()
+
+    def sink(player, action, pressed_at):
+        worker = pedal_workers.get(player)
+        if worker is None:
+            pedal_log.warning("Press for unknown player %s (%s) ignored.", player, action)
+            return
+        worker.submit(action, pressed_at)
+
+    backend = pedal_input.create_backend(backend_name or INPUT_CONFIG["backend"], INPUT_CONFIG, sink)
+    backend.start()
+    pedal_log.info("Pedal input: %s", backend.describe())
+    return backend
+
+def input_backend_from_argv(argv):
+    if "--input" in argv[:-1]:
+        return argv[argv.index("--input") + 1]
+    return INPUT_CONFIG["backend"]
+
+# --- Connection and Validation Helpers ---
+def verify_ableton_connection(client, timeout=1.0):
+    query_log.info("Verifying connection to Ableton...")
+    future = query_engine.submit(client, "/live/song/get/tempo", [])
+    client.send_message("/live/test", [])
+    tempo = query_engine.wait("/live/song/get/tempo", [], future, timeout)
+    if tempo is not None:
+        query_log.info("Received response from Ableton: tempo %s", tempo)
+        query_log.info("Successfully connected to Ableton!")
+        return True
+    else:
+        query_log.error("Could not verify connection to Ableton. Check that AbletonOSC is running.")
+        return False
+
+def check_track_has_clip(client, track_index, clip_slot_index):
+    query_log.debug("Checking if track %s, slot %s has a clip...", track_index+1, clip_slot_index+1)
+    key_args = [track_index, clip_slot_index]
+    future = query_engine.submit(client, "/live/clip_slot/get/has_clip", key_args)
+    # Older AbletonOSC builds answer on /live/clip/get/exists/return instead.
+    client.send_message("/live/clip/get/exists", key_args)
+    value = query_engine.wait("/live/clip_slot/get/has_clip", key_args, future, 0.5)
+    if value is None:
+        query_log.warning("No response received for track %s; assuming no clip.", track_index+1)
+        return False
+    has_clip = bool(int(value))
+    query_log.debug("Response: Track %s, slot %s has clip: %s", track_index+1, clip_slot_index+1, has_clip)
+    return has_clip
+
+def check_track_is_armed(client, track_index):
+    query_log.debug("Checking if track %s is armed...", track_index+1)
+    value = query_engine.query(client, "/live/track/get/arm", [track_index], 0.5)
+    if value is None:
+        query_log.warning("No response received for track %s; assuming not armed.", track_index+1)
+        return False
+    is_armed = bool(value)
+    query_log.debug("Response: Track %s is armed: %s", track_index+1, is_armed)
+    return is_armed
+
+def check_track_is_recording(client, track_index, clip_slot_index):
+    query_log.debug("Checking if track %s, slot %s is recording...", track_index+1, clip_slot_index+1)
+    value = query_engine.query(client, "/live/clip/get/is_recording", [track_index, clip_slot_index], 0.5)
+    if value is None:
+        query_log.warning("No response received for track %s, slot %s; assuming not recording.", track_index+1, clip_slot_index+1)
+        return False
+    is_recording = bool(value)
+    query_log.debug("Response: Track %s, slot %s is recording: %s", track_index+1, clip_slot_index+1, is_recording)
+    return is_recording
+
+def check_track_is_playing(client, track_index, clip_slot_index):
+    query_log.debug("Checking if track %s, slot %s is playing...", track_index+1, clip_slot_index+1)
+    value = query_engine.query(client, "/live/clip/get/is_playing", [track_index, clip_slot_index], 0.5)
+    if value is None:
+        query_log.warning("No response received for track %s, slot %s; assuming not playing.", track_index+1, clip_slot_index+1)
+        return False
+    is_playing = bool(value)
+    query_log.debug("Response: Track %s, slot %s is playing: %s", track_index+1, clip_slot_index+1, is_playing)
+    return is_playing
+
+# --- Clip Length Reconciler ---
+class ClipLengthReconciler:
+    """
+    Keeps every filled track's loop at [0, length of track 1's clip]. A pass
+    compares that desired length with what each track is observed to have
+    (loop_point_cache, or else the length we last wrote or read back), reads
+    the loop points it is missing, and only writes the tracks that drifted. Passes run when something asks for
+    one: a loop end changing, clip presence or recording state changing, or
+    the scene being cleared. Without listeners Ableton never tells us about
+    an edit to track 1, so the worker also checks every poll_interval.
+    """
+    def __init__(self, poll_interval=5.0):
+        self.poll_interval = poll_interval
+        self.desired_length = None
+        self.confirmed = {}  # Track -> loop length we wrote and read back
+        self.wakeup = threading.Event()
+        self.async_wakeup = None
+        self.loop = None  # Set under the asyncio core, where request() wakes async_wakeup instead.
+        self.running = False
+        self.thread = None
+        self.passes = 0
+        self.writes = 0
+
+    def request(self):
+        """
+        Asks for a pass. Safe from any thread; requests made during a pass
+        cause one more pass, not one each.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.async_wakeup.set)
+        else:
+            self.wakeup.set()
+
+    def reset(self):
+        self.desired_length = None
+        self.confirmed.clear()
+        self.request()
+
+    def start(self, client, state_tracker):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, args=(client, state_tracker), name="clip-length-reconciler", daemon=True)
+        self.thread.start()
+        self.request()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def _timeout(self, state_tracker):
+        return None if state_tracker.listeners_active else self.poll_interval
+
+    def _run(self, client, state_tracker):
+        while self.running:
+            self.wakeup.wait(self._timeout(state_tracker))
+            self.wakeup.clear()
+            if not self.running:
+                break
+            try:
+                self.reconcile(client, state_tracker)
+            except Exception as e:
+                sync_log.error("Error reconciling clip lengths: %s", e)
+
+    async def run_async(self, client, state_tracker):
+        self.async_wakeup = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        self.running = True
+        self.async_wakeup.set()
+        try:
+            while self.running:
+                try:
+                    await asyncio.wait_for(self.async_wakeup.wait(), self._timeout(state_tracker))
+                except asyncio.TimeoutError:
+                    pass
+                self.async_wakeup.clear()
+                try:
+                    await self.reconcile_async(client, state_tracker)
+                except Exception as e:
+                    sync_log.error("Error reconciling clip lengths: %s", e)
+        finally:
+            self.loop = None
+
+    def _base_ready(self, state_tracker):
+        if not state_tracker.get_track_has_clip(0):
+            sync_log.debug("Track 1 has no clip in scene %s. Skipping update.", state_tracker.clip_slot_index+1)
+            return False
+        if state_tracker.get_track_is_recording(0):
+            sync_log.debug("Track 1 is still recording. Skipping update.")
+            return False
+        return True
+
+    def _update_desired(self, loop_points):
+        if loop_points[0] is None or loop_points[1] is None:
+            sync_log.error("Unable to retrieve loop points for track 1's base clip.")
+            return None
+        length = loop_points[1] - loop_points[0]
+        if length <= 0:
+            # Still recording: listeners report the empty take's loop end as soon as the clip appears.
+            sync_log.debug("Track 1 clip has no length yet. Skipping update.")
+            return None
+        if length != self.desired_length:
+            sync_log.info("Base clip length: %s beats", length)
+            self.desired_length = length
+        return length
+
+    def drifted_tracks(self, state_tracker, length):
+        """
+        Filled tracks, not recording or about to, whose loop is not [0, length],
+        as (drifted, unknown). unknown tracks are neither fully cached nor
+        confirmed, e.g. a finished take whose loop_start push never came
+        because it did not change; reconcile() reads them before deciding.
+        """
+        snapshot = state_tracker.snapshot
+        filled = tracks_in_mask(snapshot.has_clip)
+        for track_idx in list(self.confirmed):
+            if track_idx not in filled:
+                del self.confirmed[track_idx]
+        # A take's has_clip push can beat its is_recording push, so tracks a player is recording on are skipped too.
+        taking = sum(1 << p.current_active_track for p in player_states.values()
+                     if p.waiting_for_refire and p.current_active_track is not None)
+        drifted = []
+        unknown = []
+        for track_idx in tracks_in_mask(snapshot.has_clip & ~snapshot.recording & ~taking):
+            observed = loop_point_cache.peek(track_idx, state_tracker.clip_slot_index)
+            if len(observed) == len(LOOP_POINT_FIELDS):
+                if observed != {"loop_start": 0.0, "loop_end": length}:
+                    drifted.append(track_idx)
+            elif self.confirmed.get(track_idx) != length:
+                unknown.append(track_idx)
+        return drifted, unknown
+
+    def _read_back(self, track_idx, loop_points, length, drifted):
+        if loop_points == [0.0, length]:
+            self.confirmed[track_idx] = length
+        else:
+            drifted.append(track_idx)
+
+    def _written(self, tracks, unconfirmed, length):
+        self.writes += len(tracks)
+        for track_idx in tracks:
+            if track_idx in unconfirmed:
+                self.confirmed.pop(track_idx, None)
+            else:
+                self.confirmed[track_idx] = length
+        if unconfirmed:
+            sync_log.error("Loop points could not be confirmed on tracks %s.", [t + 1 for t in unconfirmed])
+
+    def reconcile(self, client, state_tracker):
+        self.passes += 1
+        if not self._base_ready(state_tracker):
+            return
+        length = self._update_desired(query_clip_loop_points(client, 0, state_tracker.clip_slot_index, timeout=1.0))
+        if length is None:
+            return
+        drifted, unknown = self.drifted_tracks(state_tracker, length)
+        for track_idx in unknown:
+            loop_points = query_clip_loop_points(client, track_idx, state_tracker.clip_slot_index, timeout=1.0)
+            self._read_back(track_idx, loop_points, length, drifted)
+        if drifted:
+            sync_log.info("Updating loop points for tracks %s to match length: %s beats", [t + 1 for t in drifted], length)
+            unconfirmed = write_loop_points_acked(client, drifted, state_tracker.clip_slot_index, 0.0, length)
+            self._written(drifted, unconfirmed, length)
+
+    async def reconcile_async(self, client, state_tracker):
+        self.passes += 1
+        if not self._base_ready(state_tracker):
+            return
+        loop_points = await async_query_clip_loop_points(client, 0, state_tracker.clip_slot_index, timeout=1.0)
+        length = self._update_desired(loop_points)
+        if length is None:
+            return
+        drifted, unknown = self.drifted_tracks(state_tracker, length)
+        for track_idx in unknown:
+            loop_points = await async_query_clip_loop_points(client, track_idx, state_tracker.clip_slot_index, timeout=1.0)
+            self._read_back(track_idx, loop_points, length, drifted)
+        if drifted:
+            sync_log.info("Updating loop points for tracks %s to match length: %s beats", [t + 1 for t in drifted], length)
+            unconfirmed = await async_write_loop_points_acked(client, drifted, state_tracker.clip_slot_index, 0.0, length)
+            self._written(drifted, unconfirmed, length)
+
+    def stats(self):
+        return f"{self.passes} passes, {self.writes} track writes"
+
+clip_length_reconciler = ClipLengthReconciler()
+
+# --- Session Snapshot ---
+# The controller saves its picture of the Live set to disk and warm-starts from it,
+# so a restart only has to confirm the picture instead of rebuilding it.
+SESSION_CONFIG = {
+    "enabled": True,  # Save the session and warm-start from it (--cold skips the warm start once).
+    "path": os.path.join(os.path.dirname(os.path.abspath(__file__)), "footcontroller_session.json"),
+    "save_interval": 5.0,  # Seconds between checks for unsaved changes.
+    "verify_timeout": 0.5,  # Deadline for the warm start's check against Ableton.
+}
+
+session_file = session_store.SessionStore(SESSION_CONFIG["path"], SESSION_CONFIG["save_interval"])
+
+def layout_signature():
+    return [layout.num_players, layout.tracks_per_player, layout.allocation, layout.slots_per_track]
+
+def session_state(state_tracker, headsets):
+    """
+    Everything a restart needs, as JSON-friendly lists indexed by scene or player.
+    """
+    active = state_tracker.clip_slot_index
+    return {
+        "layout": layout_signature(),
+        "scene": active,
+        "tracks": [[getattr(snapshot, field) for field in TRACK_FIELDS] for snapshot in state_tracker.scene_snapshots],
+        "base_lengths": [base_clip_length if scene == active else scene_base_lengths.get(scene)
+                         for scene in range(state_tracker.num_scenes)],
+        "cursors": [player_states[player].current_active_track for player in layout.players],
+        "headsets": sorted([ip, port] for ip, port in headsets.destinations),
+    }
+
+def load_session():
+    """
+    Returns the saved session if there is one for the current track layout.
+    """
+    if not SESSION_CONFIG["enabled"]:
+        return None
+    saved = session_file.load()
+    if saved is None:
+        return None
+    if saved.get("layout") != layout_signature():
+        log.info("Saved session is for a different track layout; starting cold.")
+        return None
+    return saved
+
+def base_check_requests(saved):
+    """
+    Loop point queries for each saved base clip, sent by a warm start
+    alongside the presence grid (the session's checksum) so both share one
+    round trip. Returns (requests, scenes whose base clip is checked).
+    """
+    base_scenes = [scene for scene, length in enumerate(saved["base_lengths"]) if length is not None]
+    requests = []
+    for scene in base_scenes:
+        requests += loop_point_requests([0], scene)
+    return requests, base_scenes
+
+def restore_session(client, headsets, state_tracker, saved, grid, answered, base_scenes, values):
+    """
+    Diffs the saved session against Ableton's replies and restores it. Scenes
+    whose clips still match come back as saved; in a scene that changed while
+    the controller was off, has_clip is taken from Ableton and only the
+    recording/playing bits of unchanged slots are kept. Slots whose has_clip
+    query got no reply keep their saved bits. A base length is kept only if
+    its clip still has that length. Listeners and background validation
+    correct anything else. Returns the scenes that changed.
+    """
+    global base_clip_length
+    base_lengths = list(saved["base_lengths"])
+    for i, scene in enumerate(base_scenes):
+        start, end = values[2 * i], values[2 * i + 1]
+        if start is None or end is None or abs(float(end) - float(start) - base_lengths[scene]) > 1e-6:
+            base_lengths[scene] = None
+
+    snapshots = []
+    changed = []
+    for scene, (has_clip, armed, recording, playing) in enumerate(saved["tracks"]):
+        heard = state_tracker.scene_row(answered, scene)
+        live = (state_tracker.scene_row(grid, scene) & heard) | (has_clip & ~heard)
+        if live != has_clip:
+            changed.append(scene)
+            unchanged = ~(live ^ has_clip)
+            recording &= live & unchanged
+            playing &= live & unchanged
+        if not live & 1:
+            base_lengths[scene] = None
+        snapshots.append(TrackSnapshot(live, armed, recording, playing, 0))
+
+    active = saved["scene"]
+    state_tracker.restore(snapshots, active)
+    base_clip_length = base_lengths[active]
+    scene_base_lengths.clear()
+    scene_base_lengths.update({scene: length for scene, length in enumerate(base_lengths)
+                               if scene != active and length is not None})
+    # Record cursors only make sense if the scene they point into is as we left it.
+    if active not in changed:
+        batch = CommandBatch()
+        for player, track in zip(layout.players, saved["cursors"]):
+            if track is not None:
+                player_states[player].current_active_track = track
+                batch.add("/live/track/set/arm", [layout.input_track(player), 1])
+        batch.send(client)
+    # Configured addresses are already known; seen() would count them as having spoken.
+    for ip, port in saved["headsets"]:
+        if (ip, port) not in headsets.seeds:
+            headsets.seen(ip, port)
+    return changed
+
+def finish_warm_start(headsets, state_tracker, changed, started):
+    elapsed = time.perf_counter() - started
+    metrics.record("startup.warm_start", elapsed)
+    if changed:
+        log.info("Session restored in %.0f ms; scene(s) %s changed while the controller was off.",
+                 elapsed * 1000, ", ".join(str(scene + 1) for scene in changed))
+    else:
+        log.info("Session restored in %.0f ms (scene %s, base clip length: %s).",
+                 elapsed * 1000, state_tracker.clip_slot_index + 1, base_clip_length)
+    state_tracker.send_full_clip_state_update(headsets, force=True)
+
+def warm_start(client, headsets, state_tracker):
+    """
+    Restores the saved session after checking it against Ableton in one round
+    trip. Returns False if there is no usable session, in which case the
+    caller validates from scratch.
+    """
+    started = time.perf_counter()
+    saved = load_session()
+    if saved is None:
+        return False
+    requests, base_scenes = base_check_requests(saved)
+    futures = query_engine.submit_many(client, requests)
+    grid, answered = state_tracker.get_clip_presence_grid(client, timeout=SESSION_CONFIG["verify_timeout"])
+    values = query_engine.wait_all(requests, futures, SESSION_CONFIG["verify_timeout"])
+    changed = restore_session(client, headsets, state_tracker, saved, grid, answered, base_scenes, values)
+    finish_warm_start(headsets, state_tracker, changed, started)
+    return True
+
+# --- Asyncio Core ---
+# Coroutine versions of the query, finalize and sync paths. Under async_main() these
+# all run on one event loop instead of a thread per task.
+async def async_verify_ableton_connection(client, timeout=1.0):
+    query_log.info("Verifying connection to Ableton...")
+    future = query_engine.submit(client, "/live/song/get/tempo", [])
+    client.send_message("/live/test", [])
+    tempo = await query_engine.wait_async("/live/song/get/tempo", [], future, timeout)
+    if tempo is not None:
+        query_log.info("Received response from Ableton: tempo %s", tempo)
+        query_log.info("Successfully connected to Ableton!")
+        return True
+    query_log.error("Could not verify connection to Ableton. Check that AbletonOSC is running.")
+    return False
+
+async def async_query_clip_loop_points(client, track_index, clip_slot_index, timeout=6.0):
+    cached = loop_point_cache.get(track_index, clip_slot_index)
+    key_args = [track_index, clip_slot_index]
+    requests = [(f"/live/clip/get/{field}", key_args) for field in LOOP_POINT_FIELDS if field not in cached]
+    values = []
+    if requests:
+        futures = query_engine.submit_many(client, requests)
+        values = await query_engine.wait_all_async(requests, futures, timeout)
+    result = loop_points_from(cached, values)
+    query_log.debug("Final query result for track %s, slot %s: %s (%s cached)", track_index+1, clip_slot_index+1, result, len(cached))
+    return result
+
+async def async_write_loop_points_acked(client, tracks, clip_slot_index, loop_start, loop_end, retries=3, timeout=0.5):
+    pending = list(tracks)
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        send_loop_points(client, pending, clip_slot_index, loop_start, loop_end)
+        requests = loop_point_requests(pending, clip_slot_index)
+        futures = query_engine.submit_many(client, requests)
+        values = await query_engine.wait_all_async(requests, futures, timeout)
+        pending = mismatched_tracks(pending, values, loop_start, loop_end)
+        if pending:
+            sync_log.debug("Loop points not confirmed on tracks %s (attempt %s).", [t + 1 for t in pending], attempt+1)
+    return pending
+
+async def async_initialize_base_clip_length(client, state_tracker):
+    global base_clip_length
+    if not state_tracker.get_track_has_clip(0):
+        sync_log.error("Cannot initialize base clip length - track 1 has no clip in scene %s.", state_tracker.clip_slot_index+1)
+        return False
+    for attempt in range(3):
+        await asyncio.sleep(0.5)  # Give Ableton time to finish processing
+        loop_points = await async_query_clip_loop_points(client, 0, state_tracker.clip_slot_index, timeout=2.0)
+        if loop_points[0] is not None and loop_points[1] is not None:
+            base_clip_length = loop_points[1] - loop_points[0]
+            sync_log.info("Base clip length set to %s beats (attempt %s).", base_clip_length, attempt+1)
+            return True
+        sync_log.warning("Failed to get loop points on attempt %s, retrying...", attempt+1)
+    sync_log.error("Failed to initialize base clip length after multiple attempts.")
+    return False
+
+async def async_finalize_recording(client, track_index, clip_slot_index, state_tracker):
+    sync_log.debug("Finalizing recording on track %s, slot %s...", track_index+1, clip_slot_index+1)
+    stop_delay = transport_clock.seconds_until_stop(track_index)
+    if stop_delay:
+        await asyncio.sleep(stop_delay)
+    if state_tracker.listeners_active and state_tracker.get_track_is_recording(track_index):
+        await state_tracker.wait_for_async(lambda snapshot: not snapshot.is_set("recording", track_index), timeout=4.0)
+    else:
+        await asyncio.sleep(1.0)
+    loop_points = [None, None]
+    for attempt in range(20):
+        loop_points = await async_query_clip_loop_points(client, track_index, clip_slot_index, timeout=1.0)
+        if loop_points[0] is not None and loop_points[1] is not None:
+            break
+    if apply_finalized_take(track_index, clip_slot_index, loop_points, state_tracker):
+        if not correction_needed(track_index, loop_points, state_tracker):
+            sync_log.info("All takes landed on the base length grid; no loop point correction needed.")
+            return
+        await asyncio.sleep(2.0)
+        await async_update_all_clips_loop_points(client, state_tracker)
+
+async def async_update_all_clips_loop_points(client, state_tracker):
+    if base_clip_length is None:
+        if not await async_initialize_base_clip_length(client, state_tracker):
+            sync_log.error("Cannot update clips - failed to establish base length.")
+            return
+    filled_tracks = state_tracker.get_all_filled_tracks()
+    sync_log.info("Updating loop points for all clips to match length: %s beats", base_clip_length)
+    unconfirmed = await async_write_loop_points_acked(client, filled_tracks, state_tracker.clip_slot_index, 0.0, base_clip_length)
+    if unconfirmed:
+        sync_log.error("Loop points could not be confirmed on tracks %s.", [t + 1 for t in unconfirmed])
+    else:
+        sync_log.info("All clips updated to match base length.")
+
+async def async_warm_start(client, headsets, state_tracker):
+    started = time.perf_counter()
+    saved = load_session()
+    if saved is None:
+        return False
+    requests, base_scenes = base_check_requests(saved)
+    futures = query_engine.submit_many(client, requests)
+    grid, answered = await state_tracker.get_clip_presence_grid_async(client, timeout=SESSION_CONFIG["verify_timeout"])
+    values = await query_engine.wait_all_async(requests, futures, SESSION_CONFIG["verify_timeout"])
+    changed = restore_session(client, headsets, state_tracker, saved, grid, answered, base_scenes, values)
+    finish_warm_start(headsets, state_tracker, changed, started)
+    return True
+
+async def async_main():
+    """
+    Runs the controller on a single asyncio event loop: both OSC servers are
+    AsyncIOOSCUDPServer endpoints, and validation, clip length reconciling, pedal
+    workers, finalizing and clip sync are coroutines. Only the pedal input
+    backend stays on its own thread and hands presses to the loop.
+    """
+    global running, headsets
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    ableton_server = osc_server.AsyncIOOSCUDPServer(("127.0.0.1", 11001), global_dispatcher, loop)
+    ableton_transport, _ = await ableton_server.create_serve_endpoint()
+    log.info("Global OSC server started on 127.0.0.1:11001 (asyncio)")
+
+    state_tracker = StateTracker()
+    ip = "127.0.0.1"   # AbletonOSC sending address
+    port = 11000       # AbletonOSC sending port
+    client = CachedUDPClient(ip, port)
+    headsets = HeadsetTransport.from_config(HEADSET_TRANSPORT_CONFIG)
+    headset_server = osc_server.AsyncIOOSCUDPServer(("0.0.0.0", 12000), build_client2_dispatcher(client, headsets, state_tracker), loop)
+    headset_transport, _ = await headset_server.create_serve_endpoint()
+    log.info("Client2 OSC server started on 0.0.0.0:12000 (asyncio)")
+
+    log.info("Attempting to connect to AbletonOSC server at %s:%s", ip, port)
+    if not await async_verify_ableton_connection(client):
+        ableton_transport.close()
+        headset_transport.close()
+        headsets.close()
+        return
+
+    if "--cold" in sys.argv or not await async_warm_start(client, headsets, state_tracker):
+        await state_tracker.validate_state_async(client)
+    if state_tracker.use_listeners:
+        state_tracker.start_listeners(client)
+    if TRANSPORT_CONFIG["quantize"]:
+        transport_clock.start(client, loop)
+
+    stop_event = asyncio.Event()
+    tasks = [
+        loop.create_task(state_tracker.run_validation_async(client)),
+        loop.create_task(clip_length_reconciler.run_async(client, state_tracker)),
+    ]
+    for player in player_states:
+        pedal_workers[player] = AsyncPedalWorker(player, client, headsets, state_tracker, loop)
+        pedal_workers[player].start()
+
+    def stop_program():
+        log.info("Exiting foot controller...")
+        loop.call_soon_threadsafe(stop_event.set)
+
+    handle_stop_signals(stop_program, loop)
+
+    pedal_backend = start_pedal_input({
+        "sync": lambda: asyncio.run_coroutine_threadsafe(async_update_all_clips_loop_points(client, state_tracker), loop),
+        "metrics": lambda: print_metrics(state_tracker),
+        "scene_up": lambda: loop.call_soon_threadsafe(
+            select_scene, client, headsets, state_tracker, state_tracker.clip_slot_index - 1),
+        "scene_down": lambda: loop.call_soon_threadsafe(
+            select_scene, client, headsets, state_tracker, state_tracker.clip_slot_index + 1),
+        "exit": stop_program,
+    }, input_backend_from_argv(sys.argv))
+    if SESSION_CONFIG["enabled"]:
+        session_file.start(lambda: session_state(state_tracker, headsets))
+    startup_finished(started)
+
+    print("Foot controller started (asyncio core). Press 'esc' to exit.")
+    await stop_event.wait()
+
+    running = False
+    pedal_backend.stop()
+    for worker in pedal_workers.values():
+        worker.stop()
+    for task in tasks:
+        task.cancel()
+    session_file.stop()
+    state_tracker.stop_listeners(client)
+    transport_clock.stop(client)
+    ableton_transport.close()
+    headset_transport.close()
+    headsets.close()
+    log.info("Foot controller has stopped.")
+
+# --- Main and Keyboard Handling ---
+def handle_stop_signals(stop, loop=None):
+    """
+    Calls stop() on SIGINT (Ctrl+C) or SIGTERM (a service manager stopping the
+    controller), so the normal shutdown still runs: listeners are stopped and
+    the session gets its final save.
+    """
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        if loop is not None:
+            try:
+                loop.add_signal_handler(sig, stop)
+                continue
+            except NotImplementedError:
+                pass  # No loop signal handlers on Windows
+        signal.signal(sig, lambda signum, frame: stop())
+
+def startup_finished(started):
+    elapsed = time.perf_counter() - started
+    metrics.record("startup.ready", elapsed)
+    log.info("Ready for pedal presses %.0f ms after start.", elapsed * 1000)
+
+def main():
+    global running  # Use the global flag
+    global all_clips_recorded
+    global headsets
+    started = time.perf_counter()
+    start_global_osc_server()
+    state_tracker = StateTracker()  # Single StateTracker for all players
+    ip = "127.0.0.1"   # AbletonOSC sending address
+    port = 11000       # AbletonOSC sending port
+    client = CachedUDPClient(ip, port)
+    # One fan-out transport for the PC Transmitter port the headsets listen on
+    headsets = HeadsetTransport.from_config(HEADSET_TRANSPORT_CONFIG)
+    start_client2_osc_server(client, headsets, state_tracker)
+    
+    log.info("Attempting to connect to AbletonOSC server at %s:%s", ip, port)
+    if not verify_ableton_connection(client):
+        input("Press Enter to exit...")
+        return
+    
+    # Pick up the saved session, or validate every player's tracks from scratch
+    if "--cold" in sys.argv or not warm_start(client, headsets, state_tracker):
+        state_tracker.validate_state_with_ableton(client)
+    if state_tracker.use_listeners:
+        state_tracker.start_listeners(client)
+    if TRANSPORT_CONFIG["quantize"]:
+        transport_clock.start(client)
+    state_tracker.start_background_validation(client, HEADSET_TRANSPORT_CONFIG["addresses"])
+
+    print("Foot controller started.")
+    if input_backend_from_argv(sys.argv) == "keyboard":
+        for player, keys in PLAYER_KEYS.items():
+            if player in player_states:
+                print(f"- Player {player} (tracks {layout.describe(player)}): '{keys['record']}' toggles recording/refiring, "
+                      f"'{keys['stop']}' stops all clips (playback only), '{keys['fire']}' fires scene")
+        print("- Press 's' to synchronize all clips to the same length")
+        print("- Press 'm' to print latency metrics")
+        print("- Press 'up' and 'down' to switch scenes")
+        print("- Press 'esc' to exit")
+    
+    is_processing = False  # Local to main
+
+    def stop_program():
+        global running
+        log.info("Exiting foot controller...")
+        running = False  # Set the flag to False to stop the program
+
+    handle_stop_signals(stop_program)
+    
+    ## Leave in case needs to be reimplemented
+    # def force_validation(e):
+    #     nonlocal is_processing
+    #     with threading.Lock():
+    #         if is_processing:
+    #             print("Already processing a command. Please wait...")
+    #             return
+    #         is_processing = True
+    #         try:
+    #             print("Forcing state validation with Ableton...")
+    #             validate_state_with_ableton(client, state_tracker)
+    #         finally:
+    #             is_processing = False
+    
+    def sync_all_clips():
+        nonlocal is_processing
+        with threading.Lock():
+            if is_processing:
+                log.info("Already processing a command. Please wait...")
+                return
+            is_processing = True
+            try:
+                log.info("Manually triggering clip synchronization...")
+                update_all_clips_loop_points(client, state_tracker)
+            finally:
+                is_processing = False
+        
+    # Each player's presses go through that player's queue and worker
+    for player in player_states:
+        pedal_workers[player] = PedalWorker(player, client, headsets, state_tracker)
+        pedal_workers[player].start()
+
+    pedal_backend = start_pedal_input({
+        "sync": sync_all_clips,
+        "metrics": lambda: print_metrics(state_tracker),
+        "scene_up": lambda: select_scene(client, headsets, state_tracker, state_tracker.clip_slot_index - 1),
+        "scene_down": lambda: select_scene(client, headsets, state_tracker, state_tracker.clip_slot_index + 1),
+        "exit": stop_program,
+    }, input_backend_from_argv(sys.argv))
+
+    # Clip lengths are brought in line whenever the base length or clip presence changes
+    clip_length_reconciler.start(client, state_tracker)
+    if SESSION_CONFIG["enabled"]:
+        session_file.start(lambda: session_state(state_tracker, headsets))
+    startup_finished(started)
+
+    # Main loop to keep the program running
+    while running:
+        time.sleep(0.1)  # Sleep briefly to avoid busy waiting
+
+    pedal_backend.stop()
+    for worker in pedal_workers.values():
+        worker.stop()
+    clip_length_reconciler.stop()
+    session_file.stop()
+    state_tracker.stop_listeners(client)
+    transport_clock.stop(client)
+    state_tracker.stop_background_validation()
+    if global_osc_server:
+        global_osc_server.shutdown()  # Shutdown the OSC server
+    if client2_osc_server:
+        client2_osc_server.shutdown()  # Shutdown the client2 OSC server
+    headsets.close()
+    log.info("Foot controller has stopped.")
+
+# Function to safely print debug info
+def debug_print_state():
+    print("\n--- CURRENT STATE ---")
+    for player, player_state in player_states.items():
+        print(f"Player {player}: waiting_for_refire={player_state.waiting_for_refire}, track={player_state.current_active_track}")
+        worker = pedal_workers.get(player)
+        if worker:
+            print(f"Player {player}: queued={worker.queue.qsize()}, dropped={worker.dropped}, coalesced={worker.coalesced}")
+    print_metrics()
+    print("--------------------\n")
+
+def print_metrics(state_tracker=None):
+    print(metrics.dump())
+    if state_tracker is not None:
+        print(f"Headset arrays suppressed (unchanged): {state_tracker.suppressed_sends}, "
+              f"pushes coalesced: {state_tracker.coalesced_pushes}")
+    print(f"Message cache: {osc_message_cache.stats()}")
+    print(f"Loop point cache: {loop_point_cache.stats()}")
+    print(f"Clip length reconciler: {clip_length_reconciler.stats()}")
+    print(f"Session file: {session_file.stats()}")
+
+if __name__ == "__main__":
+    controller_logging.setup_logging(controller_logging.levels_from_argv(sys.argv))
+    try:
+        if "--asyncio" in sys.argv:
+            asyncio.run(async_main())
+        else:
+            main()
+    finally:
+        controller_logging.shutdown_logging()
\ No newline at end of file
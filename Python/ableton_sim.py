@@ -0,0 +1,441 @@
+"""
+Offline stand-in for Ableton Live + AbletonOSC.
+
+Listens on 11000 and replies on 11001 like AbletonOSC, and models just enough
+of a Live set for the foot controller: tracks with arm state, clip slots,
+recording, playback, loop points, the song tempo/beat and AbletonOSC
+listeners. Replies and listener pushes can be delayed, jittered and dropped,
+so validation, finalize and sync paths can be exercised reproducibly without
+Ableton (and benchmarked by bench_footcontroller.py).
+
+    python ableton_sim.py --latency-ms 4 --jitter-ms 2 --loss 0.01 --seed 1
+
+Or from Python:
+
+    sim = AbletonSim(latency=0.004, jitter=0.002, loss=0.01, seed=1)
+    sim.start()
+    ...
+    sim.stop()
+"""
+import argparse
+import heapq
+import logging
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from pythonosc import dispatcher, osc_server, udp_client
+
+log = logging.getLogger("ableton_sim")
+
+# (object, property) pairs that accept start_listen/stop_listen
+LISTENABLE = [
+    ("song", "beat"),
+    ("song", "tempo"),
+    ("track", "arm"),
+    ("clip_slot", "has_clip"),
+    ("clip", "is_playing"),
+    ("clip", "is_recording"),
+    ("clip", "loop_start"),
+    ("clip", "loop_end"),
+]
+
+class SimClip:
+    def __init__(self, loop_start=0.0, loop_end=0.0):
+        self.loop_start = loop_start
+        self.loop_end = loop_end
+        self.is_playing = False
+        self.is_recording = False
+        self.record_started = None  # Song time in beats when recording started
+
+class SimTrack:
+    def __init__(self, num_slots):
+        self.arm = False
+        self.slots = [None] * num_slots  # SimClip or None
+
+class AbletonSim:
+    """
+    A simulated Live set behind an AbletonOSC-compatible OSC interface.
+
+    latency/jitter are seconds added to every reply and listener push (jitter
+    is uniform in [0, jitter)); loss drops that fraction of replies/pushes and
+    command_loss that fraction of incoming messages. seed makes a run repeatable.
+    record_beats fixes the length of every recorded take. Otherwise takes
+    follow launch_quantization (beats, 4 = Live's default of 1 bar): a record
+    start or stop takes effect at the next multiple of it, so take lengths
+    come out in whole bars. 0 records exactly from fire to stop.
+    """
+    def __init__(self, num_tracks=10, num_slots=4, tempo=120.0, listen_port=11000, reply_port=11001,
+                 host="127.0.0.1", latency=0.0, jitter=0.0, loss=0.0, command_loss=0.0, seed=None,
+                 record_beats=None, launch_quantization=4.0):
+        self.tracks = [SimTrack(num_slots) for _ in range(num_tracks)]
+        self.tempo = tempo
+        self.host = host
+        self.listen_port = listen_port
+        self.reply_port = reply_port
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.command_loss = command_loss
+        self.record_beats = record_beats
+        self.launch_quantization = launch_quantization
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.listeners = set()  # (get address, *ids) with an active start_listen
+        self.started_at = time.monotonic()
+        self.received = Counter()  # address -> messages received
+        self.replies_sent = 0
+        self.replies_dropped = 0
+        self.commands_dropped = 0
+        self.reply_client = udp_client.SimpleUDPClient(host, reply_port)
+        self.server = None
+        self.outbox = []  # heap of (send time, sequence, address, args)
+        self.outbox_ready = threading.Condition()
+        self.sequence = 0
+        self.running = False
+        self.dispatcher = self._build_dispatcher()
+
+    # --- Lifecycle ---
+    def start(self):
+        self.running = True
+        self.server = osc_server.ThreadingOSCUDPServer((self.host, self.listen_port), self.dispatcher)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._sender_loop, daemon=True).start()
+        threading.Thread(target=self._beat_loop, daemon=True).start()
+        log.info("Simulated AbletonOSC listening on %s:%s, replying on %s", self.host, self.listen_port, self.reply_port)
+        return self
+
+    def stop(self):
+        self.running = False
+        with self.outbox_ready:
+            self.outbox_ready.notify()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def preload(self, tracks, loop_end=16.0, slot=0, playing=False):
+        """
+        Puts a finished clip in the given slot of each track, e.g. to start a
+        benchmark with a full set. Filling an empty slot pushes has_clip like
+        a new clip in Live does.
+        """
+        with self.lock:
+            for track in tracks:
+                clip = SimClip(0.0, loop_end)
+                clip.is_playing = playing
+                was_empty = self.tracks[track].slots[slot] is None
+                self.tracks[track].slots[slot] = clip
+                if was_empty:
+                    self._notify("/live/clip_slot/get/has_clip", (track, slot), True)
+
+    def stats(self):
+        return {
+            "received": sum(self.received.values()),
+            "replies_sent": self.replies_sent,
+            "replies_dropped": self.replies_dropped,
+            "commands_dropped": self.commands_dropped,
+            "by_address": dict(self.received),
+        }
+
+    def reset_stats(self):
+        self.received.clear()
+        self.replies_sent = self.replies_dropped = self.commands_dropped = 0
+
+    # --- Song time ---
+    def song_time(self):
+        return (time.monotonic() - self.started_at) * self.tempo / 60.0
+
+    def quantized(self, beat):
+        """
+        The beat a fire at song time beat takes effect on under launch quantization.
+        """
+        q = self.launch_quantization
+        if not q:
+            return beat
+        return math.ceil(beat / q - 1e-9) * q
+
+    def _beat_loop(self):
+        beat = int(self.song_time())
+        while self.running:
+            next_beat = beat + 1
+            time.sleep(max(0.0, (next_beat - self.song_time()) * 60.0 / self.tempo))
+            beat = next_beat
+            self._notify("/live/song/get/beat", (), beat)
+
+    # --- Outgoing replies and pushes ---
+    def reply(self, address, args):
+        if self.loss and self.random.random() < self.loss:
+            self.replies_dropped += 1
+            return
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay <= 0:
+            self._send(address, args)
+            return
+        with self.outbox_ready:
+            self.sequence += 1
+            heapq.heappush(self.outbox, (time.monotonic() + delay, self.sequence, address, args))
+            self.outbox_ready.notify()
+
+    def _send(self, address, args):
+        self.reply_client.send_message(address, args)
+        self.replies_sent += 1
+
+    def _sender_loop(self):
+        while self.running:
+            with self.outbox_ready:
+                while self.running and not self.outbox:
+                    self.outbox_ready.wait()
+                if not self.running:
+                    return
+                due = self.outbox[0][0] - time.monotonic()
+                if due > 0:
+                    self.outbox_ready.wait(due)
+                    continue
+                _, _, address, args = heapq.heappop(self.outbox)
+            self._send(address, args)
+
+    def _notify(self, get_address, ids, value):
+        # Listener pushes arrive on the get address, exactly like a query reply.
+        if (get_address,) + tuple(ids) in self.listeners:
+            self.reply(get_address, list(ids) + [value])
+
+    # --- Incoming OSC ---
+    def _build_dispatcher(self):
+        d = dispatcher.Dispatcher()
+        handlers = {
+            "/live/test": lambda args: self.reply("/live/test", ["ok"]),
+            "/live/song/get/tempo": lambda args: self.reply("/live/song/get/tempo", [self.tempo]),
+            "/live/song/get/beat": lambda args: self.reply("/live/song/get/beat", [int(self.song_time())]),
+            "/live/song/get/current_song_time": lambda args: self.reply("/live/song/get/current_song_time", [self.song_time()]),
+            "/live/song/stop_all_clips": lambda args: self.stop_all_clips(),
+            "/live/scene/fire": lambda args: self.fire_scene(int(args[0])),
+            "/live/track/get/arm": self._get_arm,
+            "/live/track/set/arm": self._set_arm,
+            "/live/clip_slot/get/has_clip": self._get_has_clip,
+            "/live/clip_slot/fire": lambda args: self.fire_slot(int(args[0]), int(args[1])),
+            "/live/clip_slot/delete_clip": lambda args: self.delete_clip(int(args[0]), int(args[1])),
+            "/live/clip/stop": lambda args: self.stop_clip(int(args[0]), int(args[1])),
+            "/live/clip/get/exists": self._get_exists,
+        }
+        for prop in ("is_playing", "is_recording", "loop_start", "loop_end"):
+            handlers[f"/live/clip/get/{prop}"] = lambda args, prop=prop: self._get_clip_property(prop, args)
+        for prop in ("loop_start", "loop_end"):
+            handlers[f"/live/clip/set/{prop}"] = lambda args, prop=prop: self._set_clip_property(prop, args)
+        for address, handler in handlers.items():
+            d.map(address, self._wrap(address, handler))
+        for obj, prop in LISTENABLE:
+            d.map(f"/live/{obj}/start_listen/{prop}", self._listen)
+            d.map(f"/live/{obj}/stop_listen/{prop}", self._listen)
+        d.set_default_handler(lambda address, *args: self.received.update([address]))
+        return d
+
+    def _wrap(self, address, handler):
+        def handle(unused_addr, *args):
+            self.received[address] += 1
+            if self.command_loss and self.random.random() < self.command_loss:
+                self.commands_dropped += 1
+                return
+            try:
+                with self.lock:
+                    handler(args)
+            except (IndexError, ValueError, TypeError) as e:
+                log.warning("Bad arguments for %s %s: %s", address, list(args), e)
+        return handle
+
+    def _listen(self, address, *args):
+        self.received[address] += 1
+        # /live/<object>/start_listen/<prop> -> /live/<object>/get/<prop>
+        _, live, obj, action, prop = address.split("/", 4)
+        key = (f"/{live}/{obj}/get/{prop}",) + tuple(int(a) for a in args)
+        with self.lock:
+            if action == "start_listen":
+                if obj == "clip" and self._slot_empty(key[1:]):
+                    # AbletonOSC rejects clip listeners on an empty slot; the controller re-sends them once a clip appears.
+                    log.debug("No clip to listen on: %s %s", address, list(args))
+                    return
+                self.listeners.add(key)
+                # AbletonOSC reports the current value as soon as a listener starts.
+                value = self._current_value(key)
+                if value is not None:
+                    self.reply(key[0], list(key[1:]) + [value])
+            else:
+                self.listeners.discard(key)
+
+    def _slot_empty(self, ids):
+        try:
+            return self.tracks[ids[0]].slots[ids[1]] is None
+        except IndexError:
+            return True
+
+    def _current_value(self, key):
+        address, ids = key[0], key[1:]
+        try:
+            if address == "/live/track/get/arm":
+                return int(self.tracks[ids[0]].arm)
+            if address == "/live/clip_slot/get/has_clip":
+                return self.tracks[ids[0]].slots[ids[1]] is not None
+            if address == "/live/song/get/beat":
+                return int(self.song_time())
+            if address == "/live/song/get/tempo":
+                return self.tempo
+            if address.startswith("/live/clip/get/"):
+                clip = self.tracks[ids[0]].slots[ids[1]]
+                return None if clip is None else getattr(clip, address.rsplit("/", 1)[1])
+        except IndexError:
+            return None
+        return None
+
+    # --- Getters ---
+    def _get_arm(self, args):
+        track = int(args[0])
+        self.reply("/live/track/get/arm", [track, int(self.tracks[track].arm)])
+
+    def _get_has_clip(self, args):
+        track, slot = int(args[0]), int(args[1])
+        self.reply("/live/clip_slot/get/has_clip", [track, slot, self.tracks[track].slots[slot] is not None])
+
+    def _get_exists(self, args):
+        track, slot = int(args[0]), int(args[1])
+        self.reply("/live/clip/get/exists/return", [track, slot, self.tracks[track].slots[slot] is not None])
+
+    def _get_clip_property(self, prop, args):
+        track, slot = int(args[0]), int(args[1])
+        clip = self.tracks[track].slots[slot]
+        if clip is None:
+            # AbletonOSC raises for clip getters on an empty slot, so nothing comes back.
+            return
+        self.reply(f"/live/clip/get/{prop}", [track, slot, getattr(clip, prop)])
+
+    # --- Setters and actions ---
+    def _set_arm(self, args):
+        track, value = int(args[0]), bool(int(args[1]))
+        if self.tracks[track].arm != value:
+            self.tracks[track].arm = value
+            self._notify("/live/track/get/arm", (track,), int(value))
+
+    def _set_clip_property(self, prop, args):
+        track, slot, value = int(args[0]), int(args[1]), float(args[2])
+        clip = self.tracks[track].slots[slot]
+        if clip is None or getattr(clip, prop) == value:
+            return
+        setattr(clip, prop, value)
+        self._notify(f"/live/clip/get/{prop}", (track, slot), value)
+
+    def _set_clip_flag(self, track, slot, prop, value):
+        clip = self.tracks[track].slots[slot]
+        if getattr(clip, prop) != value:
+            setattr(clip, prop, value)
+            self._notify(f"/live/clip/get/{prop}", (track, slot), value)
+
+    def fire_slot(self, track, slot):
+        with self.lock:
+            clip = self.tracks[track].slots[slot]
+            if clip is None:
+                if not self.tracks[track].arm:
+                    return
+                # Firing an empty slot on an armed track starts a new recording.
+                self._stop_track(track, except_slot=slot)
+                clip = SimClip()
+                clip.record_started = self.quantized(self.song_time())
+                self.tracks[track].slots[slot] = clip
+                self._notify("/live/clip_slot/get/has_clip", (track, slot), True)
+                self._set_clip_flag(track, slot, "is_recording", True)
+                self._set_clip_flag(track, slot, "is_playing", True)
+                return
+            if clip.is_recording:
+                self._finish_recording(track, slot)
+                return
+            self._stop_track(track, except_slot=slot)
+            self._set_clip_flag(track, slot, "is_playing", True)
+
+    def _finish_recording(self, track, slot):
+        clip = self.tracks[track].slots[slot]
+        if self.record_beats is not None:
+            length = float(self.record_beats)
+        else:
+            length = round(self.quantized(self.song_time()) - clip.record_started, 6)
+            if self.launch_quantization:
+                length = max(length, float(self.launch_quantization))
+        self._set_clip_flag(track, slot, "is_recording", False)
+        clip.loop_start = 0.0
+        clip.loop_end = length
+        self._notify("/live/clip/get/loop_end", (track, slot), length)
+
+    def _stop_track(self, track, except_slot=None):
+        for slot, clip in enumerate(self.tracks[track].slots):
+            if clip is not None and slot != except_slot:
+                self.stop_clip(track, slot)
+
+    def stop_clip(self, track, slot):
+        with self.lock:
+            clip = self.tracks[track].slots[slot]
+            if clip is None:
+                return
+            if clip.is_recording:
+                self._finish_recording(track, slot)
+            self._set_clip_flag(track, slot, "is_playing", False)
+
+    def stop_all_clips(self):
+        with self.lock:
+            for track in range(len(self.tracks)):
+                self._stop_track(track)
+
+    def fire_scene(self, scene):
+        # Like Live with "Start Recording on Scene Launch" off (the default): an empty
+        # slot stops its track instead of recording, even on an armed track.
+        with self.lock:
+            for track in range(len(self.tracks)):
+                if self.tracks[track].slots[scene] is None:
+                    self._stop_track(track)
+                else:
+                    self.fire_slot(track, scene)
+
+    def delete_clip(self, track, slot):
+        with self.lock:
+            if self.tracks[track].slots[slot] is None:
+                return
+            self.tracks[track].slots[slot] = None
+            self._notify("/live/clip_slot/get/has_clip", (track, slot), False)
+            # Listeners on the deleted clip go away with it, as they do in Live.
+            for prop in ("is_playing", "is_recording", "loop_start", "loop_end"):
+                self.listeners.discard((f"/live/clip/get/{prop}", track, slot))
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline AbletonOSC simulator for the foot controller.")
+    parser.add_argument("--tracks", type=int, default=10)
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--tempo", type=float, default=120.0)
+    parser.add_argument("--listen-port", type=int, default=11000)
+    parser.add_argument("--reply-port", type=int, default=11001)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every reply/push")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Extra uniform random delay per reply/push")
+    parser.add_argument("--loss", type=float, default=0.0, help="Fraction of replies/pushes dropped")
+    parser.add_argument("--command-loss", type=float, default=0.0, help="Fraction of incoming messages dropped")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--record-beats", type=float, default=None, help="Fixed length for recorded takes")
+    parser.add_argument("--launch-quantization", type=float, default=4.0, help="Record start/stop grid in beats (0 = none)")
+    parser.add_argument("--preload", default="", help="Comma-separated track indices that start with a 16 beat clip")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)-7s [%(name)s] %(message)s")
+    sim = AbletonSim(args.tracks, args.slots, args.tempo, args.listen_port, args.reply_port,
+                     latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, loss=args.loss,
+                     command_loss=args.command_loss, seed=args.seed, record_beats=args.record_beats,
+                     launch_quantization=args.launch_quantization)
+    if args.preload:
+        sim.preload([int(t) for t in args.preload.split(",")])
+    sim.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+        log.info("Simulator stopped: %s", sim.stats())
+
+if __name__ == "__main__":
+    main()
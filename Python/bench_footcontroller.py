@@ -0,0 +1,270 @@
+"""
+Benchmarks for the controller paths that set our real-time budget, run
+against the offline Ableton simulator (ableton_sim.py) and local fake
+headsets. No Ableton or headsets needed.
+
+For each operation it reports wall time (p50/p95/max/mean), messages sent to
+Ableton, replies/pushes Ableton sent back, query round trips and datagrams
+that reached the headsets, all per iteration.
+
+    python bench_footcontroller.py                          # run and print
+    python bench_footcontroller.py --save baseline.json     # keep a baseline
+    python bench_footcontroller.py --compare baseline.json  # exit 1 on regression
+
+Gate performance changes on --compare against a baseline from the previous commit.
+"""
+import argparse
+import json
+import platform
+import socket
+import sys
+import time
+
+import controller_logging
+import metrics
+import TESTfootcontroller as fc
+from ableton_sim import AbletonSim
+
+OPERATIONS = ["validate_state", "finalize_recording", "update_all_clips_loop_points", "fire_scene",
+              "headset_full_update", "headset_delta_update"]
+
+class HeadsetSinks:
+    """
+    Local UDP sockets standing in for the VR headsets.
+    """
+    def __init__(self, count):
+        self.sockets = []
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(("127.0.0.1", 0))
+            sock.setblocking(False)
+            self.sockets.append(sock)
+
+    def register(self, headsets):
+        for sock in self.sockets:
+            headsets.seen(*sock.getsockname())
+
+    def drain(self):
+        received = 0
+        for sock in self.sockets:
+            while True:
+                try:
+                    sock.recv(65536)
+                    received += 1
+                except BlockingIOError:
+                    break
+        return received
+
+    def close(self):
+        for sock in self.sockets:
+            sock.close()
+
+def query_count():
+    return sum(summary[0] for name, summary in metrics.summary().items() if name.startswith("query.rtt"))
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.sim = AbletonSim(num_tracks=fc.layout.num_tracks + fc.layout.num_players, latency=args.latency_ms / 1000,
+                              jitter=args.jitter_ms / 1000, loss=args.loss, seed=args.seed, record_beats=8)
+        self.sinks = HeadsetSinks(args.headsets)
+        self.client = None
+        self.tracker = None
+
+    def setup(self):
+        self.sim.start()
+        fc.start_global_osc_server()
+        self.client = fc.CachedUDPClient("127.0.0.1", 11000)
+        fc.headsets = fc.HeadsetTransport([], 0, peer_timeout=3600)
+        self.sinks.register(fc.headsets)
+        if not fc.verify_ableton_connection(self.client):
+            raise RuntimeError("Simulator did not answer")
+        self.tracker = fc.StateTracker()
+        self.tracker.start_listeners(self.client)
+
+    def teardown(self):
+        self.tracker.stop_listeners(self.client)
+        if fc.global_osc_server:
+            fc.global_osc_server.shutdown()
+            fc.global_osc_server.server_close()
+        fc.headsets.close()
+        self.sinks.close()
+        self.sim.stop()
+
+    def measure(self, name, operation, prepare=None, settle=0.05):
+        """
+        Runs operation() iterations times. prepare() runs untimed before each
+        iteration; settle lets in-flight replies land before counting.
+        """
+        timings = []
+        ableton_messages = ableton_replies = round_trips = headset_datagrams = 0
+        for _ in range(self.args.iterations):
+            if prepare:
+                prepare()
+            time.sleep(settle)
+            self.sinks.drain()
+            before = self.sim.stats()
+            queries_before = query_count()
+            started = time.perf_counter()
+            operation()
+            timings.append((time.perf_counter() - started) * 1000)
+            time.sleep(settle)
+            after = self.sim.stats()
+            ableton_messages += after["received"] - before["received"]
+            ableton_replies += after["replies_sent"] - before["replies_sent"]
+            round_trips += query_count() - queries_before
+            headset_datagrams += self.sinks.drain()
+        ordered = sorted(timings)
+        n = len(ordered)
+        return {
+            "iterations": n,
+            "wall_ms": {
+                "p50": ordered[n // 2],
+                "p95": ordered[min(n - 1, int(n * 0.95))],
+                "max": ordered[-1],
+                "mean": sum(ordered) / n,
+            },
+            "ableton_messages": ableton_messages / n,
+            "ableton_replies": ableton_replies / n,
+            "round_trips": round_trips / n,
+            "headset_datagrams": headset_datagrams / n,
+        }
+
+    # --- Operations ---
+    def bench_validate_state(self):
+        self.sim.preload(range(fc.layout.num_tracks), loop_end=16.0)
+        return self.measure("validate_state", lambda: self.tracker.validate_state_with_ableton(self.client))
+
+    def bench_finalize_recording(self):
+        # Player 1's second track, so no player fills up and the delayed full sync never starts.
+        track = fc.layout.track_for(1, 1)
+        for t in range(fc.layout.num_tracks):
+            self.sim.delete_clip(t, 0)
+        self.sim.preload([fc.layout.track_for(1, 0)], loop_end=8.0)
+        time.sleep(0.05)
+
+        def prepare():
+            self.sim.delete_clip(track, 0)
+            self.client.send_message("/live/track/set/arm", [track, 1])
+            self.client.send_message("/live/clip_slot/fire", [track, 0])
+            self.tracker.wait_for(lambda snapshot: snapshot.is_set("recording", track), timeout=1.0)
+
+        def finalize():
+            # Timed from the stop press to the take being finalized.
+            self.client.send_message("/live/clip_slot/fire", [track, 0])
+            fc.finalize_recording(self.client, track, 0, self.tracker)
+
+        return self.measure("finalize_recording", finalize, prepare)
+
+    def bench_update_all_clips_loop_points(self):
+        self.sim.preload(range(fc.layout.num_tracks), loop_end=16.0)
+        self.tracker.validate_state_with_ableton(self.client)
+        lengths = iter([8.0, 16.0] * self.args.iterations)
+
+        def prepare():
+            # Alternate the base length so every iteration really rewrites every clip.
+            fc.base_clip_length = next(lengths)
+
+        return self.measure("update_all_clips_loop_points",
+                            lambda: fc.update_all_clips_loop_points(self.client, self.tracker), prepare)
+
+    def bench_fire_scene(self):
+        self.sim.preload(range(fc.layout.num_tracks), loop_end=16.0)
+        return self.measure("fire_scene", lambda: fc.fire_scene(self.client, fc.headsets, self.tracker),
+                            lambda: self.sim.stop_all_clips())
+
+    def bench_headset_full_update(self):
+        return self.measure("headset_full_update",
+                            lambda: self.tracker.send_full_clip_state_update(fc.headsets, force=True), settle=0.01)
+
+    def bench_headset_delta_update(self):
+        toggle = iter(range(self.args.iterations * 2))
+
+        def prepare():
+            # One track's playing bit flips per iteration, so exactly one array is out of date.
+            self.tracker._set_bit("playing", 0, next(toggle) % 2 == 0)
+
+        return self.measure("headset_delta_update",
+                            lambda: self.tracker.send_full_clip_state_update(fc.headsets), prepare, settle=0.01)
+
+    def run(self, operations):
+        results = {}
+        for name in operations:
+            results[name] = getattr(self, f"bench_{name}")()
+            print_result(name, results[name])
+        return results
+
+def print_result(name, result):
+    wall = result["wall_ms"]
+    print(f"{name:<30} p50={wall['p50']:8.2f} ms  p95={wall['p95']:8.2f} ms  max={wall['max']:8.2f} ms  "
+          f"msgs={result['ableton_messages']:6.1f}  replies={result['ableton_replies']:6.1f}  "
+          f"round_trips={result['round_trips']:6.1f}  headset={result['headset_datagrams']:5.1f}")
+
+def compare(results, baseline, tolerance, slack_ms):
+    """
+    Returns a list of regressions: p50 wall time above baseline by more than
+    tolerance (plus slack_ms for timer noise), or more messages/round trips.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        limit = base["wall_ms"]["p50"] * (1 + tolerance) + slack_ms
+        if result["wall_ms"]["p50"] > limit:
+            regressions.append(f"{name}: p50 {result['wall_ms']['p50']:.2f} ms > {limit:.2f} ms "
+                               f"(baseline {base['wall_ms']['p50']:.2f} ms)")
+        for counter in ("ableton_messages", "round_trips", "headset_datagrams"):
+            if result[counter] > base[counter] * (1 + tolerance) + 0.5:
+                regressions.append(f"{name}: {counter} {result[counter]:.1f} > baseline {base[counter]:.1f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the foot controller against the Ableton simulator.")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--headsets", type=int, default=3, help="Number of fake headsets")
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.5)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", default="", help=f"Comma-separated subset of: {', '.join(OPERATIONS)}")
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown (0.2 = 20%%)")
+    parser.add_argument("--slack-ms", type=float, default=1.0, help="Absolute wall time slack for timer noise")
+    args = parser.parse_args()
+
+    controller_logging.setup_logging({subsystem: "WARNING" for subsystem in controller_logging.DEFAULT_LEVELS})
+    operations = args.only.split(",") if args.only else OPERATIONS
+    bench = Bench(args)
+    bench.setup()
+    try:
+        results = bench.run(operations)
+    finally:
+        bench.teardown()
+        controller_logging.shutdown_logging()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("save", "compare")},
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.slack_ms)
+        if regressions:
+            print("REGRESSIONS:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Logging for the foot controller.
+
+Every subsystem gets its own logger ("footcontroller.<subsystem>") with its
+own level, so a noisy one can be turned up or silenced on its own. Records go
+through a QueueHandler, and a QueueListener thread does the console I/O, so
+pedal, query and OSC server threads never block on stdout.
+
+    query       AbletonOSC queries and connection checks
+    validation  StateTracker validation passes, listener pushes and state changes
+    pedals      pedal presses, recording and the pedal workers
+    headset     headset registry, /toggletrack and headset broadcasts
+    sync        base clip length and loop point synchronization
+    controller  startup, shutdown, the session file and scene commands
+"""
+import logging
+import logging.handlers
+import queue
+import sys
+
+ROOT_LOGGER = "footcontroller"
+
+# Production defaults: the validation loop and per-query traces stay quiet.
+DEFAULT_LEVELS = {
+    "query": logging.WARNING,
+    "validation": logging.WARNING,
+    "pedals": logging.INFO,
+    "headset": logging.INFO,
+    "sync": logging.INFO,
+    "controller": logging.INFO,
+}
+
+_listener = None
+
+def get_logger(subsystem):
+    return logging.getLogger(f"{ROOT_LOGGER}.{subsystem}")
+
+def parse_level(level):
+    """
+    Returns the logging constant for a level name such as "DEBUG" ("OFF"
+    silences a subsystem). Raises ValueError for an unknown name.
+    """
+    if not isinstance(level, str):
+        return level
+    if level.upper() == "OFF":
+        return logging.CRITICAL + 1
+    value = logging.getLevelName(level.upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level {level!r} (use DEBUG, INFO, WARNING, ERROR, CRITICAL or OFF)")
+    return value
+
+def set_level(subsystem, level):
+    """
+    Changes one subsystem's level at runtime. level is a logging constant or
+    a name accepted by parse_level().
+    """
+    get_logger(subsystem).setLevel(parse_level(level))
+
+def levels_from_argv(argv):
+    """
+    Reads per-subsystem overrides from the command line: "--log query=DEBUG"
+    (repeatable, "all" for every subsystem) or "--verbose" for DEBUG everywhere.
+    Exits with an error for an unknown subsystem or level.
+    """
+    levels = {}
+    if "--verbose" in argv:
+        levels = {subsystem: "DEBUG" for subsystem in DEFAULT_LEVELS}
+    for i, arg in enumerate(argv[:-1]):
+        if arg == "--log" and "=" in argv[i + 1]:
+            subsystem, level = argv[i + 1].split("=", 1)
+            if subsystem != "all" and subsystem not in DEFAULT_LEVELS:
+                sys.exit(f"--log {argv[i + 1]}: unknown subsystem {subsystem!r} "
+                         f"(use all, {', '.join(DEFAULT_LEVELS)})")
+            try:
+                parse_level(level)
+            except ValueError as e:
+                sys.exit(f"--log {argv[i + 1]}: {e}")
+            targets = DEFAULT_LEVELS if subsystem == "all" else [subsystem]
+            levels.update({target: level for target in targets})
+    return levels
+
+def setup_logging(levels=None, stream=None):
+    """
+    Applies the subsystem levels (DEFAULT_LEVELS overridden by levels) and
+    starts the background listener that writes to stream (stdout by default).
+    Safe to call more than once; later calls only update the levels.
+    """
+    global _listener
+    for subsystem, level in {**DEFAULT_LEVELS, **(levels or {})}.items():
+        set_level(subsystem, level)
+    if _listener is not None:
+        return _listener
+
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter("%(asctime)s.%(msecs)03d %(levelname)-7s [%(name)s] %(message)s", "%H:%M:%S"))
+    root = logging.getLogger(ROOT_LOGGER)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.propagate = False
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def shutdown_logging():
+    """
+    Flushes queued records and stops the listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,95 @@
+"""
+Latency metrics for the foot controller.
+
+Each metric is a histogram of its most recent samples (kept in milliseconds)
+that reports count, p50, p95, p99 and max. TESTfootcontroller.py records:
+
+    pedal.press_to_send        key press until its OSC sends go out (quantized record start/stop: until scheduled)
+    transport.send_error       how late a scheduled record start/stop went out after its planned send time
+    headset.toggletrack        /toggletrack received until the fire/stop is sent
+    headset.broadcast          one send_full_clip_state_update to the headsets
+    query.rtt <address>        AbletonOSC query round trip, per address
+    validation.pass            one full validation pass against Ableton
+    startup.warm_start         restoring and checking the saved session at startup
+    startup.ready              program start until pedal presses are handled
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+class Histogram:
+    """
+    Rolling window of samples for one metric. Percentiles are nearest-rank
+    over the window, so they follow recent behaviour rather than the whole run.
+    """
+    def __init__(self, max_samples=1024):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0  # All samples ever recorded, not just the window
+
+    def record(self, ms):
+        self.samples.append(ms)
+        self.count += 1
+
+    def percentile(self, ordered, p):
+        index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+    def summary(self):
+        """
+        Returns (count, p50_ms, p95_ms, p99_ms, max_ms), or None with no samples.
+        """
+        ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        return (self.count, self.percentile(ordered, 50), self.percentile(ordered, 95),
+                self.percentile(ordered, 99), ordered[-1])
+
+class MetricsRegistry:
+    def __init__(self, max_samples=1024):
+        self.max_samples = max_samples
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.max_samples)
+            histogram.record(seconds * 1000)
+
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def summary(self):
+        """
+        Returns {name: (count, p50_ms, p95_ms, p99_ms, max_ms)} sorted by name.
+        """
+        with self.lock:
+            summaries = {name: histogram.summary() for name, histogram in self.histograms.items()}
+        return {name: summaries[name] for name in sorted(summaries) if summaries[name]}
+
+    def dump(self):
+        lines = ["--- LATENCY METRICS (ms) ---"]
+        summaries = self.summary()
+        if not summaries:
+            lines.append("No samples recorded yet.")
+        for name, (count, p50, p95, p99, max_ms) in summaries.items():
+            lines.append(f"{name:<44} n={count:<6} p50={p50:7.2f} p95={p95:7.2f} p99={p99:7.2f} max={max_ms:7.2f}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+registry = MetricsRegistry()
+record = registry.record
+timed = registry.timed
+summary = registry.summary
+dump = registry.dump
+reset = registry.reset
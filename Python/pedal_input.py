@@ -0,0 +1,225 @@
+"""
+Pedal input backends for the foot controller.
+
+Every backend turns its input into (player, action) presses and hands them to
+one sink, sink(player, action, pressed_at), stamped with time.perf_counter()
+as early as the backend sees the press. The controller's sink queues them on
+the per-player pedal workers, so the rest of the code does not care where a
+press came from. player is None for controller-wide actions (sync, metrics,
+scene_up, scene_down, exit).
+
+    keyboard  global keyboard hook via the `keyboard` package (needs root on Linux)
+    evdev     reads the USB foot pedal's /dev/input device directly (Linux, `evdev` package)
+    midi      a MIDI foot controller on a local port (`mido` + a backend such as python-rtmidi)
+    osc       /pedal [player, action] messages on a local UDP port
+
+Only the keyboard backend sees other keystrokes; the rest can run headless as
+a service.
+"""
+import threading
+import time
+
+from pythonosc import dispatcher, osc_server
+
+try:
+    import evdev
+except ImportError:
+    evdev = None
+
+try:
+    import mido
+except ImportError:
+    mido = None
+
+class KeyboardBackend:
+    """
+    bindings: {key name: (player, action)}, as accepted by keyboard.on_press_key.
+    """
+    def __init__(self, bindings, sink):
+        self.bindings = bindings
+        self.sink = sink
+        self.hooks = []
+
+    def start(self):
+        import keyboard  # Imported here so headless backends never load the global hook
+        self.keyboard = keyboard
+        for key, (player, action) in self.bindings.items():
+            self.hooks.append(keyboard.on_press_key(
+                key, lambda e, player=player, action=action: self.sink(player, action, time.perf_counter())))
+
+    def stop(self):
+        for hook in self.hooks:
+            self.keyboard.unhook(hook)
+        self.hooks = []
+
+    def describe(self):
+        return "keyboard hook"
+
+class EvdevBackend:
+    """
+    Reads key events straight from an input device, e.g. a USB foot pedal that
+    presents itself as a keyboard. bindings: {evdev key name ("KEY_A"): (player, action)}.
+    device is a /dev/input path; without one, the first device whose name
+    contains name_contains is used. grab takes the device exclusively so its
+    keystrokes do not also reach other applications.
+    """
+    def __init__(self, bindings, sink, device=None, name_contains="pedal", grab=True):
+        self.bindings = bindings
+        self.sink = sink
+        self.device_path = device
+        self.name_contains = name_contains
+        self.grab = grab
+        self.device = None
+        self.thread = None
+
+    def find_device(self):
+        if self.device_path:
+            return evdev.InputDevice(self.device_path)
+        for path in evdev.list_devices():
+            device = evdev.InputDevice(path)
+            if self.name_contains.lower() in device.name.lower():
+                return device
+            device.close()
+        raise RuntimeError(f"No input device with '{self.name_contains}' in its name; set the evdev device path.")
+
+    def start(self):
+        if evdev is None:
+            raise RuntimeError("The evdev input backend needs the 'evdev' package (pip install evdev).")
+        self.device = self.find_device()
+        if self.grab:
+            self.device.grab()
+        self.thread = threading.Thread(target=self._run, name="pedal-evdev", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            for event in self.device.read_loop():
+                # value 1 is key down; 0 (up) and 2 (autorepeat) are ignored.
+                if event.type != evdev.ecodes.EV_KEY or event.value != 1:
+                    continue
+                pressed_at = time.perf_counter()
+                names = evdev.ecodes.KEY.get(event.code, [])
+                for name in (names if isinstance(names, list) else [names]):
+                    if name in self.bindings:
+                        player, action = self.bindings[name]
+                        self.sink(player, action, pressed_at)
+                        break
+        except OSError:
+            pass  # Device closed by stop() or unplugged
+
+    def stop(self):
+        if self.device:
+            try:
+                if self.grab:
+                    self.device.ungrab()
+            except OSError:
+                pass
+            self.device.close()
+            self.device = None
+
+    def describe(self):
+        return f"evdev device {self.device.path} ({self.device.name})" if self.device else "evdev"
+
+class MidiBackend:
+    """
+    MIDI foot controller input. bindings: {("control_change", number) or
+    ("note_on", note) or ("program_change", program): (player, action)}.
+    A control change counts as a press when its value crosses to >= 64; a
+    note_on with velocity 0 is a release. port is a substring of the input
+    port name; without one the first input port is used.
+    """
+    def __init__(self, bindings, sink, port=None):
+        self.bindings = bindings
+        self.sink = sink
+        self.port_name = port
+        self.port = None
+        self.cc_down = set()
+
+    def start(self):
+        if mido is None:
+            raise RuntimeError("The MIDI input backend needs the 'mido' package (pip install mido python-rtmidi).")
+        names = mido.get_input_names()
+        matches = [name for name in names if self.port_name is None or self.port_name.lower() in name.lower()]
+        if not matches:
+            raise RuntimeError(f"No MIDI input port matching {self.port_name!r} (available: {names})")
+        self.port = mido.open_input(matches[0], callback=self._on_message)
+
+    def _on_message(self, message):
+        pressed_at = time.perf_counter()
+        if message.type == "control_change":
+            key = ("control_change", message.control)
+            if message.value < 64:
+                self.cc_down.discard(key)
+                return
+            if key in self.cc_down:
+                return
+            self.cc_down.add(key)
+        elif message.type == "note_on" and message.velocity > 0:
+            key = ("note_on", message.note)
+        elif message.type == "program_change":
+            key = ("program_change", message.program)
+        else:
+            return
+        if key in self.bindings:
+            player, action = self.bindings[key]
+            self.sink(player, action, pressed_at)
+
+    def stop(self):
+        if self.port:
+            self.port.close()
+            self.port = None
+
+    def describe(self):
+        return f"MIDI port {self.port.name}" if self.port else "MIDI"
+
+class OSCBackend:
+    """
+    /pedal [player, action] on a local UDP port, for pedals bridged from
+    another device or process. Player 0 means a controller-wide action.
+    """
+    def __init__(self, sink, host="127.0.0.1", port=12001):
+        self.sink = sink
+        self.host = host
+        self.port = port
+        self.server = None
+
+    def start(self):
+        osc_dispatcher = dispatcher.Dispatcher()
+        osc_dispatcher.map("/pedal", self._on_pedal)
+        self.server = osc_server.ThreadingOSCUDPServer((self.host, self.port), osc_dispatcher)
+        threading.Thread(target=self.server.serve_forever, name="pedal-osc", daemon=True).start()
+
+    def _on_pedal(self, addr, *args):
+        pressed_at = time.perf_counter()
+        if len(args) < 2:
+            return
+        player = int(args[0]) or None
+        self.sink(player, str(args[1]), pressed_at)
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def describe(self):
+        return f"OSC /pedal on {self.host}:{self.port}"
+
+def create_backend(name, config, sink):
+    """
+    Builds the backend called name from its section of config (see INPUT_CONFIG
+    in TESTfootcontroller.py).
+    """
+    if name == "keyboard":
+        return KeyboardBackend(config["keyboard"]["bindings"], sink)
+    if name == "evdev":
+        section = config["evdev"]
+        return EvdevBackend(section["bindings"], sink, section.get("device"), section.get("name_contains", "pedal"),
+                            section.get("grab", True))
+    if name == "midi":
+        section = config["midi"]
+        return MidiBackend(section["bindings"], sink, section.get("port"))
+    if name == "osc":
+        section = config["osc"]
+        return OSCBackend(sink, section.get("host", "127.0.0.1"), section.get("port", 12001))
+    raise ValueError(f"Unknown input backend: {name}")
@@ -0,0 +1,145 @@
+"""
+On-disk session snapshot for the foot controller.
+
+The controller keeps what it has learned about the Live set (every scene's
+track masks, the active scene, base clip lengths, the players' record cursors
+and the known headsets) in one small JSON file, so a restart can pick up
+where it left off instead of rebuilding everything from Ableton. The file
+carries a CRC32 of its contents; a torn or hand-edited file is ignored.
+
+    store = SessionStore("footcontroller_session.json")
+    state = store.load()              # None if missing, damaged or from another version
+    store.start(build_state)          # background saver, writes only when build_state() changes
+    store.request()                   # save soon, e.g. after a take or a scene switch
+    store.stop()                      # final save
+"""
+import json
+import os
+import threading
+import zlib
+
+import controller_logging
+
+FORMAT_VERSION = 1
+
+log = controller_logging.get_logger("controller")
+
+def encode(state):
+    """
+    Serializes state (JSON types only, no int dict keys) with its checksum.
+    """
+    payload = json.dumps(state, separators=(",", ":"), sort_keys=True)
+    return json.dumps({"version": FORMAT_VERSION, "crc": zlib.crc32(payload.encode()), "state": state},
+                      separators=(",", ":"), sort_keys=True).encode()
+
+def decode(data):
+    """
+    Returns the state stored by encode(), or None if data is not a valid
+    session of this format version.
+    """
+    try:
+        document = json.loads(data)
+        state = document["state"]
+        crc = document["crc"]
+        version = document["version"]
+    except (ValueError, TypeError, KeyError):
+        return None
+    if version != FORMAT_VERSION:
+        return None
+    if zlib.crc32(json.dumps(state, separators=(",", ":"), sort_keys=True).encode()) != crc:
+        return None
+    return state
+
+class SessionStore:
+    """
+    Loads and saves the session file. Saves go to a temporary file that is
+    then renamed over the old one, so a crash mid-write leaves the previous
+    session intact, and identical snapshots are not rewritten.
+    """
+    def __init__(self, path, interval=5.0):
+        self.path = path
+        self.interval = interval  # Seconds between checks for changes when nothing asks for a save.
+        self.last_written = None
+        self.saves = 0
+        self.build_state = None
+        self.running = False
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            log.warning("Could not read session file %s: %s", self.path, e)
+            return None
+        state = decode(data)
+        if state is None:
+            log.warning("Ignoring damaged or outdated session file %s.", self.path)
+            return None
+        self.last_written = data
+        return state
+
+    def save(self, state):
+        """
+        Writes state if it differs from what is on disk. Returns True if it wrote.
+        """
+        data = encode(state)
+        if data == self.last_written:
+            return False
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            log.warning("Could not save session to %s: %s", self.path, e)
+            return False
+        self.last_written = data
+        self.saves += 1
+        return True
+
+    # --- Background saver ---
+    def start(self, build_state):
+        """
+        Saves build_state() whenever request() is called, and every interval
+        seconds in case something changed without asking.
+        """
+        self.build_state = build_state
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="session-saver", daemon=True)
+        self.thread.start()
+
+    def request(self):
+        self.wakeup.set()
+
+    def _run(self):
+        while self.running:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            if self.running:
+                self._save_current()
+
+    def _save_current(self):
+        try:
+            self.save(self.build_state())
+        except Exception as e:
+            log.error("Error building session snapshot: %s", e)
+
+    def stop(self):
+        """
+        Stops the saver and writes the final state.
+        """
+        if self.build_state is None:
+            return
+        self.running = False
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+        self._save_current()
+
+    def stats(self):
+        return f"{self.saves} saves, {len(self.last_written or b'')} bytes at {self.path}"